@@ -0,0 +1,78 @@
+import copy
+import sys
+from datetime import datetime
+from pathlib import Path
+
+from bson.objectid import ObjectId
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "project"))
+
+from schemas.school import SchoolModel  # noqa: E402
+
+PERIOD = {"beginDate": "2020-08-01", "endDate": "2021-06-01"}
+
+SCHOOL = {
+    "schoolId": 255901001,
+    "nameOfInstitution": "Grand Bend High School",
+    "shortNameOfInstitution": "GBHS",
+    "webSite": "http://www.GBISD.edu/GBHS/",
+    "administrativeFundingControlDescriptor": "uri://ed-fi.org/AdministrativeFundingControlDescriptor#Public School",
+    "charterStatusDescriptor": "uri://ed-fi.org/CharterStatusDescriptor#Not a Charter School",
+    "schoolTypeDescriptor": "uri://ed-fi.org/SchoolTypeDescriptor#Regular",
+    "localEducationAgencyReference": {"localEducationAgencyId": 255901},
+    "educationOrganizationCategories": [
+        {
+            "educationOrganizationCategoryDescriptor": "uri://ed-fi.org/EducationOrganizationCategoryDescriptor#School"
+        }
+    ],
+    "gradeLevels": [
+        {"gradeLevelDescriptor": f"uri://ed-fi.org/GradeLevelDescriptor#{grade}"}
+        for grade in ["Ninth grade", "Tenth grade", "Eleventh grade", "Twelfth grade"]
+    ],
+    "schoolCategories": [
+        {
+            "schoolCategoryDescriptor": "uri://ed-fi.org/SchoolCategoryDescriptor#High School"
+        }
+    ],
+    "addresses": [
+        {
+            "addressTypeDescriptor": f"uri://ed-fi.org/AddressTypeDescriptor#{kind}",
+            "stateAbbreviationDescriptor": "uri://ed-fi.org/StateAbbreviationDescriptor#TX",
+            "city": "Grand Bend",
+            "postalCode": "78834",
+            "streetNumberName": "456 Oaks Street",
+            "nameOfCounty": "Williston",
+            "periods": [PERIOD],
+        }
+        for kind in ["Physical", "Mailing"]
+    ],
+    "identificationCodes": [
+        {
+            "educationOrganizationIdentificationSystemDescriptor": "uri://ed-fi.org/EducationOrganizationIdentificationSystemDescriptor#SEA",
+            "identificationCode": "255901001",
+        }
+    ],
+    "indicators": [
+        {
+            "indicatorDescriptor": "uri://ed-fi.org/IndicatorDescriptor#Accountability Rating",
+            "indicatorValue": "Met Standard",
+            "periods": [PERIOD],
+        }
+    ],
+}
+
+
+def school_payload(school_id: int = 255901001, lea_id: int = 255901) -> dict:
+    """A POST /schools body with its own identifiers"""
+    payload = copy.deepcopy(SCHOOL)
+    payload["schoolId"] = school_id
+    payload["localEducationAgencyReference"] = {"localEducationAgencyId": lea_id}
+    return payload
+
+
+def stored_document() -> dict:
+    """The document as create_school writes it"""
+    document = SchoolModel(**SCHOOL).mongo()
+    document["_id"] = ObjectId()
+    document["last_modified_date"] = datetime.utcnow()
+    return document
@@ -0,0 +1,146 @@
+"""
+In-process load test of the API against a local stand-in for Mongo
+
+Requests go through the full ASGI stack (middleware, routing, validation,
+serialization) without a network. mongomock answers the queries, so the
+numbers measure the application, not a database. The response caches are
+off unless PAGE_CACHE_STORE or SCHOOL_CACHE_SIZE is set.
+
+    python benchmarks/load.py
+"""
+import asyncio
+import itertools
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Sequence
+
+import httpx
+from fixtures import school_payload
+from mongomock_motor import AsyncMongoMockClient
+
+import database
+
+SEED_SCHOOLS = 500
+LEAS = 10
+PAGE = 100
+
+Scenario = Callable[[httpx.AsyncClient, int], Awaitable[httpx.Response]]
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def summarize(latencies: List[float], elapsed: float, errors: int) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "rps": len(ordered) / elapsed,
+        "p50_ms": percentile(ordered, 0.50) * 1000,
+        "p95_ms": percentile(ordered, 0.95) * 1000,
+        "p99_ms": percentile(ordered, 0.99) * 1000,
+    }
+
+
+async def measure(
+    client: httpx.AsyncClient, scenario: Scenario, concurrency: int, total: int
+) -> dict:
+    """Runs total requests from concurrency workers and times each one"""
+    latencies = []
+    errors = 0
+    counter = itertools.count()
+
+    async def worker() -> None:
+        nonlocal errors
+        while (i := next(counter)) < total:
+            start = time.perf_counter()
+            response = await scenario(client, i)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - start, errors)
+
+
+def scenarios(ids: Sequence[str]) -> Dict[str, Scenario]:
+    new_school_ids = itertools.count(900000000)
+
+    async def post_school(client, i):
+        payload = school_payload(next(new_school_ids), 255900 + i % LEAS)
+        return await client.post("/schools", json=payload)
+
+    async def get_school(client, i):
+        return await client.get(f"/schools/{ids[i % len(ids)]}")
+
+    async def list_offset(client, i):
+        offset = (i * PAGE) % SEED_SCHOOLS
+        return await client.get("/schools", params={"offset": offset, "limit": PAGE})
+
+    async def list_filtered(client, i):
+        params = {"localEducationAgencyId": 255900 + i % LEAS, "limit": PAGE}
+        return await client.get("/schools", params=params)
+
+    return {
+        "post_school": post_school,
+        "get_school": get_school,
+        "list_offset": list_offset,
+        "list_filtered": list_filtered,
+    }
+
+
+async def start_api():
+    """
+    Starts the app with the stand-in client in place of Motor's
+    The item and page caches are off, read before main is imported, so
+    repeated reads measure the request path rather than cache hits
+    """
+    os.environ.setdefault("MONGODB_URL", "mongodb://localhost:27017")
+    os.environ.setdefault("PAGE_CACHE_STORE", "off")
+    os.environ.setdefault("SCHOOL_CACHE_SIZE", "0")
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    stand_in = AsyncMongoMockClient()
+    database.AsyncIOMotorClient = lambda url, **options: stand_in
+    from main import api
+
+    await api.router.startup()
+    return api
+
+
+async def seed(client: httpx.AsyncClient) -> List[str]:
+    payloads = [
+        school_payload(255900000 + i, 255900 + i % LEAS) for i in range(SEED_SCHOOLS)
+    ]
+    response = await client.post("/schools/bulk", json=payloads)
+    return [item["id"] for item in response.json()]
+
+
+async def run_async(levels: Sequence[int], total: int) -> Dict[str, dict]:
+    api = await start_api()
+    results = {}
+    try:
+        async with httpx.AsyncClient(app=api, base_url="http://bench") as client:
+            ids = await seed(client)
+            for name, scenario in scenarios(ids).items():
+                await measure(client, scenario, 1, 10)
+                for concurrency in levels:
+                    key = f"load.{name}.c{concurrency}"
+                    results[key] = await measure(client, scenario, concurrency, total)
+    finally:
+        await api.router.shutdown()
+    return results
+
+
+def run(levels: Sequence[int] = (1, 8, 32), total: int = 200) -> Dict[str, dict]:
+    return asyncio.run(run_async(levels, total))
+
+
+if __name__ == "__main__":
+    for name, result in run().items():
+        print(
+            f"{name:<28} {result['rps']:8.1f} req/s  p50 {result['p50_ms']:7.2f} ms"
+            f"  p95 {result['p95_ms']:7.2f} ms  p99 {result['p99_ms']:7.2f} ms"
+        )
@@ -0,0 +1,62 @@
+"""
+Micro-benchmarks for the per-document work behind each request
+
+    python benchmarks/micro.py
+"""
+import json
+import timeit
+from typing import Callable, Dict
+
+from fastapi.encoders import jsonable_encoder
+from fixtures import SCHOOL, stored_document
+from schemas.school import CreateSchoolModel, SchoolModel
+from serializers import DocumentSerializer, content_hash
+from validation import CompiledValidator, ModelValidator
+
+
+def response_model_path(document: dict) -> bytes:
+    """
+    What FastAPI does with a SchoolModel built by from_mongo: re-validation
+    against response_model, jsonable_encoder and json.dumps
+    """
+    # from_mongo pops _id, so it gets its own copy like a fresh find_one
+    model = SchoolModel.from_mongo(dict(document))
+    validated = SchoolModel(**model.dict(by_alias=True))
+    return json.dumps(jsonable_encoder(validated)).encode()
+
+
+def cases() -> Dict[str, Callable[[], object]]:
+    document = stored_document()
+    model = SchoolModel.from_mongo(dict(document))
+    school = CreateSchoolModel(**SCHOOL)
+    serializer = DocumentSerializer(SchoolModel)
+    assert json.loads(response_model_path(document)) == json.loads(
+        serializer.dumps(document)
+    )
+    pydantic_validator = ModelValidator(CreateSchoolModel)
+    compiled_validator = CompiledValidator(CreateSchoolModel)
+    assert compiled_validator.fast(SCHOOL) == pydantic_validator.parse(SCHOOL)
+    return {
+        "CreateSchoolModel(**payload)": lambda: CreateSchoolModel(**SCHOOL),
+        "SchoolModel.from_mongo": lambda: SchoolModel.from_mongo(dict(document)),
+        "SchoolModel.mongo": model.mongo,
+        "jsonable_encoder(SchoolModel)": lambda: jsonable_encoder(model),
+        "content_hash": lambda: content_hash(school.mongo()),
+        "read path: response_model": lambda: response_model_path(document),
+        "read path: DocumentSerializer": lambda: serializer.dumps(document),
+        "ingest: pydantic validator": lambda: pydantic_validator.parse(SCHOOL),
+        "ingest: compiled validator": lambda: compiled_validator.parse(SCHOOL),
+    }
+
+
+def run(number: int = 2000) -> Dict[str, dict]:
+    results = {}
+    for name, func in cases().items():
+        seconds = min(timeit.repeat(func, number=number, repeat=5))
+        results[f"micro.{name}"] = {"us_per_op": seconds / number * 1e6}
+    return results
+
+
+if __name__ == "__main__":
+    for name, result in run().items():
+        print(f"{name:<45} {result['us_per_op']:10.1f} us/op")
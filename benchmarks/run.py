@@ -0,0 +1,92 @@
+"""
+Runs the micro and load benchmarks and compares them with a baseline
+
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --baseline results.json
+
+Results are a flat JSON object of benchmark name -> metrics. With
+--baseline, any metric worse than the baseline by more than --tolerance
+is reported and the exit status is 1.
+"""
+import argparse
+import json
+import platform
+import sys
+from datetime import datetime
+
+import load
+import micro
+
+# metrics where a larger value is better; every other metric is a cost
+HIGHER_IS_BETTER = {"rps"}
+COMPARED = {"rps", "p50_ms", "p95_ms", "p99_ms", "us_per_op"}
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            before = baseline.get(name, {}).get(metric)
+            if metric not in COMPARED or not before:
+                continue
+            change = value / before - 1
+            if metric in HIGHER_IS_BETTER:
+                change = -change
+            marker = "REGRESSION" if change > tolerance else ""
+            print(
+                f"{name:<45} {metric:<10} {before:10.2f} -> {value:10.2f} "
+                f"{change:+7.1%} {marker}"
+            )
+            if marker:
+                regressions.append((name, metric, change))
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--only", choices=["micro", "load"])
+    parser.add_argument("--levels", default="1,8,32", help="load concurrency levels")
+    parser.add_argument(
+        "--requests", type=int, default=200, help="per scenario and level"
+    )
+    parser.add_argument("--number", type=int, default=2000, help="micro iterations")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="compare with this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    args = parser.parse_args()
+
+    results = {}
+    if args.only != "load":
+        results.update(micro.run(args.number))
+    if args.only != "micro":
+        levels = [int(level) for level in args.levels.split(",")]
+        results.update(load.run(levels, args.requests))
+
+    for name, metrics in results.items():
+        print(name, json.dumps({k: round(v, 3) for k, v in metrics.items()}))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "meta": {
+                        "created": datetime.utcnow().isoformat(),
+                        "python": platform.python_version(),
+                        "machine": platform.machine(),
+                    },
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        if compare(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+import contextvars
+import logging
+import os
+import random
+import time
+import uuid
+
+from logger import request_id
+
+access_logger = logging.getLogger("access")
+
+# share of successful requests to log; errors are always logged
+sample_rate = float(os.environ.get("ACCESS_LOG_SAMPLE_RATE", 1.0))
+
+# [seconds] of MongoDB command time for the current request; a list so the
+# driver's executor threads, which run in a copy of the context, can add to it
+mongo_time: contextvars.ContextVar[list | None] = contextvars.ContextVar(
+    "mongo_time", default=None
+)
+
+# ASGI scope of the current request, for code that runs below the router
+request_scope: contextvars.ContextVar[dict | None] = contextvars.ContextVar(
+    "request_scope", default=None
+)
+
+
+def add_mongo_time(seconds: float) -> None:
+    total = mongo_time.get()
+    if total is not None:
+        total[0] += seconds
+
+
+class AccessLogMiddleware:
+    """
+    ASGI middleware writing one JSON access log entry per request
+    Takes the request id from X-Request-ID or makes one, and echoes it back
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = dict(scope["headers"]).get(b"x-request-id")
+        rid = incoming.decode("latin-1")[:128] if incoming else uuid.uuid4().hex
+        request_id.set(rid)
+        request_scope.set(scope)
+        mongo_time.set(spent := [0.0])
+        status = 500
+
+        async def logged_send(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"x-request-id", rid.encode("latin-1")),
+                ]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, logged_send)
+        finally:
+            elapsed = time.perf_counter() - start
+            if status >= 400 or sample_rate >= 1 or random.random() < sample_rate:
+                route = scope.get("route")
+                access_logger.info(
+                    "request",
+                    extra={
+                        "fields": {
+                            "method": scope["method"],
+                            "path": scope["path"],
+                            "route": getattr(route, "path", None),
+                            "status": status,
+                            "latencyMs": round(elapsed * 1000, 3),
+                            "mongoMs": round(spent[0] * 1000, 3),
+                        }
+                    },
+                )
@@ -0,0 +1,196 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Deque, Dict
+
+import metrics
+import orjson
+
+enabled = os.environ.get("ADMISSION_CONTROL", "true").lower() == "true"
+# identifies clients, e.g. a header set by the proxy; the peer address otherwise
+client_header = os.environ.get("ADMISSION_CLIENT_HEADER", "").lower().encode()
+# requests one client may have admitted or queued at once; 0 for no limit
+# Off unless clients are identified by a header, since behind a proxy every
+# request has the proxy's address
+client_limit = int(os.environ.get("ADMISSION_CLIENT_LIMIT", 32 if client_header else 0))
+retry_after = os.environ.get("ADMISSION_RETRY_AFTER", "1")
+
+# never limited, so health checks and scrapes get through under load
+EXEMPT = ("/metrics", "/admin", "/docs", "/redoc", "/openapi.json")
+
+shed_body = orjson.dumps(
+    {"detail": "The server is too busy to take the request. Retry later."}
+)
+
+
+def route_class(method: str, path: str) -> str | None:
+    """Which limit a request counts against, or None when it is not limited"""
+    if path == "/" or path.startswith(EXEMPT):
+        return None
+    if path.endswith("/bulk") or path.endswith("/export"):
+        return "bulk"
+    if method in ("GET", "HEAD"):
+        return "read"
+    return "write"
+
+
+class Limiter:
+    """
+    Admits up to limit requests at once; up to queue_size more wait, first
+    come first served, for at most timeout seconds
+    """
+
+    def __init__(self, name: str, limit: int, queue_size: int, timeout: float) -> None:
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+
+    async def acquire(self) -> str | None:
+        """None once admitted, or why the request is shed"""
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            return None
+        if len(self.waiters) >= self.queue_size:
+            return "queue_full"
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append(future)
+        metrics.admission_queue_depth.inc(self.name)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            # release may hand over the slot as the deadline passes, and
+            # wait_for then raises anyway on Python 3.12+
+            if future.done() and not future.cancelled():
+                return None
+            return "timeout"
+        except asyncio.CancelledError:
+            # the client went away after release handed it a slot
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        finally:
+            metrics.admission_queue_depth.dec(self.name)
+            metrics.admission_wait.observe(time.perf_counter() - start, self.name)
+            if future in self.waiters:
+                self.waiters.remove(future)
+        return None
+
+    def release(self) -> None:
+        # the slot passes straight to the next waiter still waiting
+        while self.waiters:
+            future = self.waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "queued": len(self.waiters),
+            "queueSize": self.queue_size,
+            "queueTimeout": self.timeout,
+        }
+
+
+def limiters_from_env() -> Dict[str, Limiter]:
+    """
+    ADMISSION_{READ,WRITE,BULK}_LIMIT set the concurrent requests of each
+    route class; 0 leaves the class unlimited
+    """
+    queue_size = int(os.environ.get("ADMISSION_QUEUE_SIZE", 128))
+    timeout = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT_MS", 1000)) / 1000
+    defaults = {"read": 64, "write": 32, "bulk": 4}
+    limiters = {}
+    for name, default in defaults.items():
+        limit = int(os.environ.get(f"ADMISSION_{name.upper()}_LIMIT", default))
+        if limit > 0:
+            limiters[name] = Limiter(name, limit, queue_size, timeout)
+    return limiters
+
+
+limiters = limiters_from_env() if enabled else {}
+
+# client -> requests admitted or queued
+clients: Dict[str, int] = {}
+
+
+def client_key(scope: dict) -> str:
+    if client_header:
+        value = dict(scope["headers"]).get(client_header)
+        if value:
+            return value.decode("latin-1")
+    client = scope.get("client")
+    return client[0] if client else ""
+
+
+def stats() -> dict:
+    return {
+        "routeClasses": {name: limiter.stats() for name, limiter in limiters.items()},
+        "clients": len(clients),
+        "clientLimit": client_limit,
+    }
+
+
+async def shed(send, name: str, reason: str) -> None:
+    metrics.admission_shed.inc(name, reason)
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(shed_body)).encode()),
+                (b"retry-after", retry_after.encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": shed_body})
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware limiting concurrent requests per route class and per
+    client, so a saturated worker answers excess requests at once with 503
+    and Retry-After instead of queueing them behind the connection pool
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        name = route_class(scope["method"], scope["path"])
+        limiter = limiters.get(name)
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        client = client_key(scope)
+        if client_limit and clients.get(client, 0) >= client_limit:
+            await shed(send, name, "client_limit")
+            return
+        clients[client] = clients.get(client, 0) + 1
+        try:
+            reason = await limiter.acquire()
+            if reason:
+                await shed(send, name, reason)
+                return
+            metrics.admission_active.inc(name)
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                metrics.admission_active.dec(name)
+                limiter.release()
+        finally:
+            clients[client] -= 1
+            if not clients[client]:
+                del clients[client]
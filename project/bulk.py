@@ -0,0 +1,68 @@
+from typing import Dict, List, Tuple
+
+from change_queries import change_versions
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError
+
+CREATED = "created"
+UPDATED = "updated"
+UNCHANGED = "unchanged"
+ERROR = "error"
+
+
+async def bulk_upsert(
+    collection: AsyncIOMotorCollection,
+    documents: List[Tuple[int, dict]],
+    key: str,
+) -> Dict[int, dict]:
+    """
+    Upserts (item index, stored document) pairs keyed on their natural key
+    Documents whose content_hash matches the stored one are not written
+    Written documents take consecutive change versions reserved in one call
+    Returns a result per item index; one failed write does not fail the rest
+    """
+    keys = [document[key] for _, document in documents]
+    existing = {
+        record[key]: record
+        async for record in collection.find(
+            {key: {"$in": keys}}, {key: 1, "content_hash": 1}
+        )
+    }
+
+    results = {}
+    changed = []
+    for index, document in documents:
+        stored = existing.get(document[key])
+        if stored and stored.get("content_hash") == document["content_hash"]:
+            results[index] = {"status": UNCHANGED, "id": stored["_id"]}
+            continue
+        changed.append((index, document, stored))
+    if not changed:
+        return results
+
+    async with change_versions(collection.database, len(changed)) as newest:
+        operations = []
+        for position, (_, document, _) in enumerate(changed):
+            document["change_version"] = newest - len(changed) + 1 + position
+            operations.append(ReplaceOne({key: document[key]}, document, upsert=True))
+
+        try:
+            result = await collection.bulk_write(operations, ordered=False)
+            upserted = result.upserted_ids
+            errors = {}
+        except BulkWriteError as e:
+            upserted = {u["index"]: u["_id"] for u in e.details["upserted"]}
+            errors = {w["index"]: w["errmsg"] for w in e.details["writeErrors"]}
+
+    for position, (index, _, stored) in enumerate(changed):
+        if position in errors:
+            results[index] = {"status": ERROR, "errors": [errors[position]]}
+        elif position in upserted:
+            results[index] = {"status": CREATED, "id": upserted[position]}
+        else:
+            results[index] = {
+                "status": UPDATED,
+                "id": stored["_id"] if stored else None,
+            }
+    return results
@@ -0,0 +1,352 @@
+"""
+Loads schools from a JSON array or NDJSON file, optionally gzipped,
+straight into MongoDB using the API's client settings
+
+    python bulk_load.py schools.ndjson.gz
+    python bulk_load.py schools.ndjson.gz --resume
+
+Records are validated against createschoolmodel in a process pool and
+upserted on schoolId through unordered bulk writes, several in flight at a
+time; a batch waits for earlier ones sharing a schoolId, so the last
+record in the file wins. Rejected records go to <file>.rejects.ndjson with
+their errors. Progress is checkpointed to <file>.checkpoint; --resume skips
+records before the checkpoint. Records after it may be written twice, which
+is harmless since identical content is not rewritten. A batch that fails to
+write stops the load with exit status 1, its records still after the
+checkpoint.
+
+Running API workers see the loaded schools once their caches expire, or
+at once with SCHOOL_CACHE_CHANGE_STREAM enabled.
+"""
+import argparse
+import asyncio
+import gzip
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import IO, Dict, Iterator, List, Tuple
+
+import database
+import descriptors
+import orjson
+from bulk import CREATED, ERROR, UNCHANGED, UPDATED, bulk_upsert
+from pydantic import ValidationError
+from routers.school import schools
+
+# (position in the file, raw NDJSON line or parsed record)
+Chunk = List[Tuple[int, bytes | dict]]
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+def open_input(path: str) -> IO[bytes]:
+    with open(path, "rb") as f:
+        gzipped = f.read(2) == b"\x1f\x8b"
+    return gzip.open(path, "rb") if gzipped else open(path, "rb")
+
+
+def array_items(f: IO[bytes], block: int = 1 << 16) -> Iterator[dict]:
+    """
+    Yields the elements of a JSON array whose opening bracket has been read,
+    decoding one at a time so the file is never held whole
+    """
+    decoder = json.JSONDecoder()
+    text = io.TextIOWrapper(f, encoding="utf-8")
+    buffer, at, eof = "", 0, False
+    # what may come next: "first" is a value or "]", "value" only a value,
+    # "separator" a "," or "]"
+    expect = "first"
+    while True:
+        at = WHITESPACE.match(buffer, at).end()
+        if at == len(buffer):
+            if eof:
+                raise ValueError("The JSON array is not closed.")
+            buffer, at = text.read(block), 0
+            eof = not buffer
+            continue
+        char = buffer[at]
+        if char == "]" and expect != "value":
+            return
+        if expect == "separator":
+            if char != ",":
+                raise ValueError(
+                    f"Expected ',' or ']' in the JSON array, not {char!r}."
+                )
+            at += 1
+            expect = "value"
+            continue
+        try:
+            item, end = decoder.raw_decode(buffer, at)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            end = None
+        # an element cut off by the block, or a number that may go on there
+        if end is None or (not eof and (end == len(buffer) or buffer[end] in ".eE+-")):
+            more = text.read(block)
+            buffer, at, eof = buffer[at:] + more, 0, not more
+            continue
+        yield item
+        at = end
+        expect = "separator"
+
+
+def read_records(path: str, start: int) -> Iterator[Tuple[int, bytes | dict]]:
+    """
+    Yields (position, record) from start on
+    NDJSON is streamed line by line, a JSON array element by element
+    """
+    with open_input(path) as f:
+        first = f.read(1)
+        while first.isspace():
+            first = f.read(1)
+        if first == b"[":
+            for position, record in enumerate(array_items(f)):
+                if position >= start:
+                    yield position, record
+            return
+        position = 0
+        for line in itertools.chain([first + f.readline()], f):
+            if not line.strip():
+                continue
+            if position >= start:
+                yield position, line
+            position += 1
+
+
+def chunks(records: Iterator, size: int) -> Iterator[Chunk]:
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def validate(chunk: Chunk) -> Tuple[list, list]:
+    """
+    Runs in a pool process
+    Returns the stored documents and the rejects of a chunk; when a
+    schoolId repeats, the last record wins as in POST /schools/bulk
+    """
+    documents = {}
+    rejects = []
+    for position, raw in chunk:
+        try:
+            record = orjson.loads(raw) if isinstance(raw, bytes) else raw
+            fields = schools.create_validator.parse(record)
+        except orjson.JSONDecodeError as e:
+            rejects.append((position, [str(e)], raw))
+            continue
+        except ValidationError as e:
+            rejects.append((position, e.errors(), raw))
+            continue
+        key = fields[schools.key]
+        if key in documents:
+            superseded, _, earlier = documents[key]
+            rejects.append(
+                (
+                    superseded,
+                    ["Superseded by a later record with the same schoolId."],
+                    earlier,
+                )
+            )
+        documents[key] = (position, schools.document(fields), raw)
+    stored = [(position, document) for position, document, _ in documents.values()]
+    return stored, rejects
+
+
+class Progress:
+    """Counts results and tracks the position every earlier record is done by"""
+
+    def __init__(self, checkpoint: str, start: int, interval: float) -> None:
+        self.checkpoint = checkpoint
+        self.done_before = start
+        self.finished = {}
+        self.counts = {CREATED: 0, UPDATED: 0, UNCHANGED: 0, ERROR: 0}
+        # errors of chunks that could not be written
+        self.failures: List[BaseException] = []
+        self.started = time.monotonic()
+        self.interval = interval
+        self.reported = self.started
+
+    def record(self, start: int, end: int, results: List[str]) -> None:
+        for result in results:
+            self.counts[result] += 1
+        self.finished[start] = end
+        advanced = False
+        while self.done_before in self.finished:
+            self.done_before = self.finished.pop(self.done_before)
+            advanced = True
+        if advanced:
+            self.save()
+        if time.monotonic() - self.reported >= self.interval:
+            self.report()
+
+    def save(self) -> None:
+        partial = f"{self.checkpoint}.partial"
+        with open(partial, "wb") as f:
+            f.write(orjson.dumps({"position": self.done_before}))
+        os.replace(partial, self.checkpoint)
+
+    def report(self) -> None:
+        self.reported = time.monotonic()
+        total = sum(self.counts.values())
+        rate = total / max(self.reported - self.started, 1e-9)
+        counts = ", ".join(f"{name} {count}" for name, count in self.counts.items())
+        print(f"{total} records ({rate:.0f}/s): {counts}", file=sys.stderr)
+
+
+def read_checkpoint(path: str) -> int:
+    try:
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())["position"]
+    except FileNotFoundError:
+        return 0
+
+
+def reject_line(position: int, errors: list, raw: bytes | dict) -> bytes:
+    record = raw
+    if isinstance(raw, bytes):
+        try:
+            record = orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            record = raw.decode("utf-8", "replace").rstrip("\n")
+    return (
+        orjson.dumps(
+            {"position": position, "errors": errors, "record": record}, default=str
+        )
+        + b"\n"
+    )
+
+
+async def wait_for_earlier(
+    documents: list, earlier: List[Tuple[asyncio.Future, asyncio.Task]]
+) -> None:
+    """
+    Waits for the chunks in flight before this one that hold any of its
+    schoolIds, so records repeated across chunks are written in file order
+    """
+    keys = {document[schools.key] for _, document in documents}
+    for validated, task in earlier:
+        await asyncio.wait([validated])
+        if validated.cancelled() or validated.exception():
+            continue
+        if not keys.isdisjoint(
+            document[schools.key] for _, document in validated.result()[0]
+        ):
+            await asyncio.wait([task])
+
+
+async def write_chunk(
+    chunk: Chunk,
+    validated: asyncio.Future,
+    earlier: List[Tuple[asyncio.Future, asyncio.Task]],
+    progress: Progress,
+    rejects: IO[bytes],
+) -> None:
+    documents, rejected = await validated
+    await wait_for_earlier(documents, earlier)
+    await descriptors.compact(
+        [document for _, document in documents], schools.serializer.table
+    )
+    results = await bulk_upsert(
+        database.collection(schools.name), documents, schools.key
+    )
+    statuses = [result["status"] for result in results.values()]
+    statuses += [ERROR] * len(rejected)
+    raws = dict(chunk)
+    for position, result in results.items():
+        if result["status"] == ERROR:
+            rejected.append((position, result["errors"], raws[position]))
+    for position, errors, raw in rejected:
+        rejects.write(reject_line(position, errors, raw))
+    # rejects must be on disk before the checkpoint moves past them
+    rejects.flush()
+    progress.record(chunk[0][0], chunk[-1][0] + 1, statuses)
+
+
+async def load(args: argparse.Namespace) -> Progress:
+    checkpoint = args.checkpoint or f"{args.path}.checkpoint"
+    rejects_path = args.rejects or f"{args.path}.rejects.ndjson"
+    start = read_checkpoint(checkpoint) if args.resume else 0
+    progress = Progress(checkpoint, start, args.progress_interval)
+
+    await database.connect()
+    await schools.create_indexes()
+    await descriptors.registry.load()
+    loop = asyncio.get_running_loop()
+    writes = asyncio.Semaphore(args.pipeline)
+    # write tasks in file order, with the validation each one waits on
+    pending: Dict[asyncio.Task, asyncio.Future] = {}
+
+    def finished(task: asyncio.Task) -> None:
+        pending.pop(task, None)
+        writes.release()
+        if not task.cancelled() and task.exception():
+            progress.failures.append(task.exception())
+
+    try:
+        # spawned, not forked, since the driver and logger already run threads
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(args.workers, mp_context=context) as pool, open(
+            rejects_path, "ab" if args.resume else "wb"
+        ) as rejects:
+            for chunk in chunks(read_records(args.path, start), args.batch_size):
+                # bounds validated chunks waiting on a writer as well as writes
+                await writes.acquire()
+                if progress.failures:
+                    writes.release()
+                    break
+                validated = loop.run_in_executor(pool, validate, chunk)
+                earlier = [(before, task) for task, before in pending.items()]
+                task = asyncio.create_task(
+                    write_chunk(chunk, validated, earlier, progress, rejects)
+                )
+                pending[task] = validated
+                task.add_done_callback(finished)
+            await asyncio.gather(*pending, return_exceptions=True)
+    finally:
+        await database.close()
+    progress.report()
+    for error in progress.failures:
+        print(f"A batch failed to write: {error!r}", file=sys.stderr)
+    return progress
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("path", help="JSON array or NDJSON file, optionally gzipped")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="validation processes",
+    )
+    parser.add_argument(
+        "--pipeline",
+        type=int,
+        default=8,
+        help="batches validated or written at once",
+    )
+    parser.add_argument("--rejects", help="default: <path>.rejects.ndjson")
+    parser.add_argument("--checkpoint", help="default: <path>.checkpoint")
+    parser.add_argument(
+        "--resume", action="store_true", help="continue from the checkpoint"
+    )
+    parser.add_argument("--progress-interval", type=float, default=2.0)
+    progress = asyncio.run(load(parser.parse_args()))
+    sys.exit(1 if progress.counts[ERROR] or progress.failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+class TTLCache:
+    """
+    Small in-process cache with least-recently-used eviction
+    Entries expire ttl seconds after they are stored
+    Bounded by entry count and, when weigh is given, by total weight
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: float = 30.0,
+        maxweight: int | None = None,
+        weigh: Callable[[Any], int] | None = None,
+    ) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxweight = maxweight
+        self.weigh = weigh
+        self.weight = 0
+        # bumped on every invalidation so fills that raced a write are dropped
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._entries: OrderedDict = OrderedDict()
+
+    def get(self, key: Hashable) -> Any | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires, value, weight = entry
+        if expires < time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, generation: int | None = None) -> None:
+        """
+        Stores value; with generation, only if nothing was invalidated since
+        """
+        if generation is not None and generation != self.generation:
+            return
+        if key in self._entries:
+            self._remove(key)
+        weight = self.weigh(value) if self.weigh else 0
+        self._entries[key] = (time.monotonic() + self.ttl, value, weight)
+        self.weight += weight
+        while len(self._entries) > self.maxsize or (
+            self.maxweight is not None and self.weight > self.maxweight
+        ):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        self.generation += 1
+        self.invalidations += 1
+        if key in self._entries:
+            self._remove(key)
+
+    def clear(self) -> None:
+        self.generation += 1
+        self.invalidations += 1
+        self._entries.clear()
+        self.weight = 0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "weight": self.weight,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+    def _remove(self, key: Hashable) -> None:
+        _, _, weight = self._entries.pop(key)
+        self.weight -= weight
+
+    def __len__(self) -> int:
+        return len(self._entries)
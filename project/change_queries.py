@@ -0,0 +1,90 @@
+import os
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator
+
+from bson.objectid import ObjectId
+from fastapi import Query
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+
+# fields that keep their stored value when a write changes nothing
+VERSION_FIELDS = ("last_modified_date", "change_version")
+
+# seconds an unreleased reservation holds newestChangeVersion back; older
+# ones are taken to belong to a worker that died mid-write
+reservation_timeout = float(os.environ.get("CHANGE_VERSION_RESERVATION_TIMEOUT", 60))
+
+
+@asynccontextmanager
+async def change_versions(
+    database: AsyncIOMotorDatabase, count: int = 1
+) -> AsyncIterator[int]:
+    """
+    Reserves count consecutive change versions from the counter document
+    and yields the highest one; the block is (result - count, result]
+    The reservation is recorded with the counter and released on exit, once
+    the writes stamped with the block have finished; until then
+    newest_change_version stays below it
+    """
+    token = str(ObjectId())
+    counter = await database.counters.find_one_and_update(
+        {"_id": "change_version"},
+        [
+            {"$set": {"value": {"$add": [{"$ifNull": ["$value", 0]}, count]}}},
+            {"$set": {f"reserved.{token}": {"$subtract": ["$value", count - 1]}}},
+        ],
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    try:
+        yield counter["value"]
+    finally:
+        await database.counters.update_one(
+            {"_id": "change_version"}, {"$unset": {f"reserved.{token}": ""}}
+        )
+
+
+async def newest_change_version(database: AsyncIOMotorDatabase) -> int:
+    """
+    Highest change version below every write still in progress, so a sync
+    up to it cannot skip a write that commits later
+    """
+    counter = await database.counters.find_one({"_id": "change_version"})
+    if not counter:
+        return 0
+    expired = datetime.now(timezone.utc) - timedelta(seconds=reservation_timeout)
+    pending = []
+    abandoned = {}
+    for token, first in counter.get("reserved", {}).items():
+        if ObjectId(token).generation_time < expired:
+            abandoned[f"reserved.{token}"] = ""
+        else:
+            pending.append(first)
+    if abandoned:
+        await database.counters.update_one(
+            {"_id": "change_version"}, {"$unset": abandoned}
+        )
+    return min(pending) - 1 if pending else counter["value"]
+
+
+def change_version_filter(
+    min_change_version: int
+    | None = Query(
+        default=None,
+        alias="minChangeVersion",
+        description="Used in synchronization to set sequence minimum ChangeVersion",
+    ),
+    max_change_version: int
+    | None = Query(
+        default=None,
+        alias="maxChangeVersion",
+        description="Used in synchronization to set sequence maximum ChangeVersion",
+    ),
+) -> dict:
+    bounds = {}
+    if min_change_version is not None:
+        bounds["$gte"] = min_change_version
+    if max_change_version is not None:
+        bounds["$lte"] = max_change_version
+    return {"change_version": bounds} if bounds else {}
@@ -0,0 +1,78 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Hashable, List, Set
+
+import metrics
+
+
+class WriteCoalescer:
+    """
+    Group commit for single-record writes
+    Items submitted within window seconds of the first pending one, up to
+    max_batch of them, are handed to flush together; flush returns one
+    result or exception per item, in order, and each caller gets its own
+    Items with the same key never share a batch: a second one starts the
+    next batch, so writes to one record apply in the order they arrived
+    """
+
+    def __init__(
+        self,
+        name: str,
+        flush: Callable[[List[Any]], Awaitable[List[Any]]],
+        window: float,
+        max_batch: int,
+        key: Callable[[Any], Hashable],
+    ) -> None:
+        self.name = name
+        self.flush = flush
+        self.window = window
+        self.max_batch = max_batch
+        self.key = key
+        self._pending: List[tuple] = []
+        self._keys: Set[Hashable] = set()
+        self._timer: asyncio.TimerHandle | None = None
+        self._flushes: set = set()
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = self.key(item)
+        if key in self._keys:
+            self._flush_pending()
+        self._keys.add(key)
+        self._pending.append((item, future, time.perf_counter()))
+        if len(self._pending) >= self.max_batch:
+            self._flush_pending()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush_pending)
+        return await future
+
+    def _flush_pending(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        self._keys = set()
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            # held so the task is not collected mid-flush
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _run(self, batch: List[tuple]) -> None:
+        started = time.perf_counter()
+        for _, _, submitted in batch:
+            metrics.coalescer_wait.observe(started - submitted, self.name)
+        metrics.coalescer_batch.observe(len(batch), self.name)
+        try:
+            results = await self.flush([item for item, _, _ in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+        for (_, future, _), result in zip(batch, results):
+            if future.done():
+                # the caller went away
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -1,5 +1,99 @@
-import sys
+import asyncio
+import os
 
-from google.cloud import firestore
+import metrics
+import slow_queries
+from logger import logger
+from motor.motor_asyncio import (
+    AsyncIOMotorClient,
+    AsyncIOMotorCollection,
+    AsyncIOMotorDatabase,
+)
+from pymongo.read_preferences import (
+    Primary,
+    _ServerMode,
+    make_read_preference,
+    read_pref_mode_from_name,
+)
 
-db = firestore.Client()
+# environment variable -> MongoClient option
+pool_options = {
+    "MONGODB_MAX_POOL_SIZE": "maxPoolSize",
+    "MONGODB_MIN_POOL_SIZE": "minPoolSize",
+    "MONGODB_MAX_IDLE_TIME_MS": "maxIdleTimeMS",
+    "MONGODB_WAIT_QUEUE_TIMEOUT_MS": "waitQueueTimeoutMS",
+    "MONGODB_CONNECT_TIMEOUT_MS": "connectTimeoutMS",
+    "MONGODB_SOCKET_TIMEOUT_MS": "socketTimeoutMS",
+    "MONGODB_SERVER_SELECTION_TIMEOUT_MS": "serverSelectionTimeoutMS",
+}
+
+database_name = os.environ.get("MONGODB_DATABASE", "edfi")
+
+client: AsyncIOMotorClient | None = None
+read_preference: _ServerMode = Primary()
+
+
+def client_options() -> dict:
+    return {
+        option: int(os.environ[variable])
+        for variable, option in pool_options.items()
+        if os.environ.get(variable)
+    }
+
+
+def read_preference_from_env() -> _ServerMode:
+    """
+    Read preference for GET traffic, e.g. secondaryPreferred
+    Writes always go to the primary
+    """
+    mode = read_pref_mode_from_name(
+        os.environ.get("MONGODB_READ_PREFERENCE", "primary")
+    )
+    if mode == Primary().mode:
+        return Primary()
+    staleness = int(os.environ.get("MONGODB_MAX_STALENESS_SECONDS", -1))
+    return make_read_preference(mode, None, staleness)
+
+
+async def connect() -> None:
+    """
+    Opens the client and warms the pool before the worker takes traffic
+    """
+    global client, read_preference
+    options = client_options()
+    client = AsyncIOMotorClient(
+        os.environ["MONGODB_URL"],
+        event_listeners=[*metrics.event_listeners(), *slow_queries.listeners()],
+        **options,
+    )
+    read_preference = read_preference_from_env()
+    warm = max(options.get("minPoolSize", 0), 1)
+    await asyncio.gather(
+        *(client.admin.command("ping") for _ in range(warm)),
+        *(
+            client.admin.command("ping", read_preference=read_preference)
+            for _ in range(warm if read_preference.mode else 0)
+        ),
+    )
+    logger.info(f"Connected to MongoDB with {warm} warm connection(s)")
+
+
+async def close() -> None:
+    global client
+    if client is not None:
+        client.close()
+        client = None
+
+
+def get_database() -> AsyncIOMotorDatabase:
+    return client[database_name]
+
+
+def collection(name: str) -> AsyncIOMotorCollection:
+    """Collection for writes and reads that must see them, on the primary"""
+    return client[database_name][name]
+
+
+def read_collection(name: str) -> AsyncIOMotorCollection:
+    """Collection for GET traffic, using the configured read preference"""
+    return client[database_name].get_collection(name, read_preference=read_preference)
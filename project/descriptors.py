@@ -0,0 +1,170 @@
+import sys
+from typing import Any, Callable, Dict, Iterable, List, Set, TypeVar
+
+import database
+from logger import logger
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+
+
+T = TypeVar("T")
+
+
+class UnknownDescriptor(Exception):
+    """A stored id this worker has not loaded"""
+
+
+def is_descriptor(name: str) -> bool:
+    return name.endswith("_descriptor") or name.endswith("Descriptor")
+
+
+class DescriptorRegistry:
+    """
+    Two-way table between descriptor URIs and the compact integer ids they
+    are stored as, loaded whole into memory since there are only a few
+    hundred of them
+    Ids are never reused, so a table that only grows stays correct
+    """
+
+    def __init__(self) -> None:
+        self.ids: Dict[str, int] = {}
+        self.uris: Dict[int, str] = {}
+        self.newest = 0
+        # ids found in documents that no descriptor record has
+        self.missing: Set[int] = set()
+
+    def add(self, id: int, uri: str) -> None:
+        uri = sys.intern(uri)
+        self.ids[uri] = id
+        self.uris[id] = uri
+        self.newest = max(self.newest, id)
+
+    async def load(self) -> None:
+        await database.collection("descriptors").create_index("uri", unique=True)
+        await self.refresh()
+        logger.info(f"Loaded {len(self.ids)} descriptors")
+
+    async def refresh(self) -> None:
+        """Reads descriptors other workers added since the last refresh"""
+        async for record in database.collection("descriptors").find(
+            {"_id": {"$gt": self.newest}}
+        ):
+            self.add(record["_id"], record["uri"])
+
+    async def register(self, uris: Iterable[str]) -> None:
+        """
+        Gives every unknown URI an id
+        When two workers race on a URI the unique index keeps the first
+        """
+        unknown = sorted({uri for uri in uris if uri not in self.ids})
+        if not unknown:
+            return
+        await self.refresh()
+        unknown = [uri for uri in unknown if uri not in self.ids]
+        if not unknown:
+            return
+        counter = await database.collection("counters").find_one_and_update(
+            {"_id": "descriptor"},
+            {"$inc": {"value": len(unknown)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        first = counter["value"] - len(unknown) + 1
+        records = [{"_id": first + i, "uri": uri} for i, uri in enumerate(unknown)]
+        try:
+            await database.collection("descriptors").insert_many(records, ordered=False)
+        except BulkWriteError:
+            # another worker stored some of these URIs first; read theirs
+            pass
+        async for record in database.collection("descriptors").find(
+            {"uri": {"$in": unknown}}
+        ):
+            self.add(record["_id"], record["uri"])
+
+    async def lookup(self, uri: str) -> int | None:
+        if uri not in self.ids:
+            await self.refresh()
+        return self.ids.get(uri)
+
+    def expand(self, value):
+        """
+        URI for a stored id; values that are not ids were stored before
+        descriptors were compacted and are already URIs
+        Raises UnknownDescriptor for an id added by another worker since the
+        last refresh; expanding() reads it without blocking the event loop
+        """
+        if not isinstance(value, int):
+            return value
+        uri = self.uris.get(value)
+        if uri is None:
+            if value in self.missing:
+                return value
+            raise UnknownDescriptor(value)
+        return uri
+
+    async def expanding(self, serialize: Callable[..., T], *args: Any) -> T:
+        """
+        Runs a serializer that expands descriptors, reading the ids it does
+        not know and running it again
+        """
+        while True:
+            try:
+                return serialize(*args)
+            except UnknownDescriptor as e:
+                await self.fetch(e.args[0])
+
+    async def fetch(self, id: int) -> None:
+        await self.refresh()
+        if id in self.uris:
+            return
+        # inserted out of order, after a higher id was already read
+        record = await database.collection("descriptors").find_one({"_id": id})
+        if record is None:
+            self.missing.add(id)
+        else:
+            self.add(record["_id"], record["uri"])
+
+
+registry = DescriptorRegistry()
+
+
+def rewrite(document: dict, table: list, convert: Callable) -> None:
+    """Applies convert to every descriptor value of a stored document"""
+    for stored, _, nested, descriptor in table:
+        value = document.get(stored)
+        if value is None:
+            continue
+        if descriptor:
+            document[stored] = convert(value)
+        elif nested is not None:
+            for item in value if isinstance(value, list) else [value]:
+                rewrite(item, nested, convert)
+
+
+async def compact(documents: List[dict], table: list) -> None:
+    """Replaces descriptor URIs in documents about to be stored with ids"""
+    uris = set()
+
+    def collect(uri):
+        uris.add(uri)
+        return uri
+
+    for document in documents:
+        rewrite(document, table, collect)
+    await registry.register(uris)
+    for document in documents:
+        rewrite(document, table, registry.ids.__getitem__)
+
+
+async def compact_filters(filters: dict, paths: Iterable[str]) -> dict:
+    """
+    Resolves descriptor filter values to ids
+    Documents stored before compaction still hold the URI, so both match
+    """
+    resolved = dict(filters)
+    for path in paths:
+        uri = resolved.get(path)
+        if isinstance(uri, str):
+            id = await registry.lookup(uri)
+            resolved[path] = uri if id is None else {"$in": [id, uri]}
+    return resolved
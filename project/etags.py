@@ -0,0 +1,31 @@
+def etag(content_hash: str) -> str:
+    return f'"{content_hash}"'
+
+
+def parse_etags(header: str) -> set:
+    """
+    Reads an If-Match or If-None-Match header into bare hash values
+    Weak validators compare like strong ones since the hash covers content
+    """
+    values = set()
+    for value in header.split(","):
+        value = value.strip()
+        if value.startswith("W/"):
+            value = value[2:]
+        values.add(value.strip('"'))
+    return values
+
+
+def etag_matches(header: str, content_hash: str | None) -> bool:
+    values = parse_etags(header)
+    if "*" in values:
+        return content_hash is not None
+    return content_hash in values
+
+
+def if_match_filter(header: str) -> dict:
+    """Restricts a write to documents still carrying one of the given ETags"""
+    etags = parse_etags(header)
+    if "*" in etags:
+        return {"content_hash": {"$exists": True}}
+    return {"content_hash": {"$in": list(etags)}}
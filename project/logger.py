@@ -1,20 +1,81 @@
+import atexit
+import contextvars
 import logging
+import logging.handlers
 import os
+import queue
 import socket
-import time
+from datetime import datetime, timezone
+
+import orjson
+
+hostname = socket.gethostname()
+
+# set per request by the access log middleware
+request_id: contextvars.ContextVar[str | None] = contextvars.ContextVar(
+    "request_id", default=None
+)
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    One JSON object per line; extra={"fields": {...}} adds keys to it
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.process,
+            "host": hostname,
+        }
+        if getattr(record, "request_id", None):
+            entry["requestId"] = record.request_id
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return orjson.dumps(entry, default=str).decode()
+
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """
+    Resolves what only the calling task knows (message arguments, request
+    id, traceback) and leaves the formatting and writing to the listener
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.request_id = request_id.get()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
 
 
 def create_logger() -> logging.Logger:
-    tz = time.strftime("%z")
-    logging.basicConfig(
-        format=(
-            f"[%(asctime)s.%(msecs)03d {tz}] "
-            f"[%(process)s] [{socket.gethostname()}] [%(pathname)s L%(lineno)d] "
-            "[%(levelname)s] %(message)s"
-        ),
-        level=os.environ.get("LOGLEVEL", "INFO").upper(),
-        datefmt="%Y-%m-%d %H:%M:%S",
+    """
+    Log calls only enqueue the record; a listener thread formats and writes
+    it, so logging never blocks the event loop on I/O
+    """
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = LogQueueHandler(records)
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(JSONFormatter())
+    listener = logging.handlers.QueueListener(
+        records, stream_handler, respect_handler_level=True
     )
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(os.environ.get("LOGLEVEL", "INFO").upper())
     logger = logging.getLogger(__name__)
     return logger
 
@@ -1,10 +1,17 @@
+import asyncio
 import os
 import time
 from typing import Any, Callable
 
 from fastapi import FastAPI, Request
 
-from routers import school
+import database
+import descriptors
+import resources
+from access_log import AccessLogMiddleware
+from admission import AdmissionMiddleware
+from metrics import MetricsMiddleware
+from routers import admin, change_queries, metrics, school
 
 os.environ["TZ"] = "UTC"
 
@@ -13,6 +20,10 @@ tags_metadata = [
         "name": "schools",
         "description": "This entity represents an educational organization that includes staff and students who participate in classes and educational activity groups.",
     },
+    {
+        "name": "changeQueries",
+        "description": "Change version ranges for incremental synchronization.",
+    },
 ]
 
 description = """
@@ -30,15 +41,41 @@ api = FastAPI(
 )
 
 
+background_tasks = set()
+
+
+@api.on_event("startup")
+async def startup() -> None:
+    await database.connect()
+    await descriptors.registry.load()
+    for resource in resources.resources:
+        await resource.create_indexes()
+        if resource.change_stream:
+            background_tasks.add(asyncio.create_task(resource.watch_changes()))
+
+
+@api.on_event("shutdown")
+async def shutdown() -> None:
+    for task in background_tasks:
+        task.cancel()
+    await database.close()
+
+
 @api.middleware("http")
 async def add_process_time_header(request: Request, call_next: Callable) -> Any:
-    start_time = time.time()
+    start_time = time.perf_counter()
     response = await call_next(request)
-    process_time = time.time() - start_time
+    process_time = time.perf_counter() - start_time
     response.headers["X-Process-Time"] = str(process_time)
     return response
 
 
+# inside the metrics and access log, so shed requests are still recorded
+api.add_middleware(AdmissionMiddleware)
+api.add_middleware(MetricsMiddleware)
+api.add_middleware(AccessLogMiddleware)
+
+
 @api.get("/", include_in_schema=False)
 def get_metadata():
     return {
@@ -55,3 +92,6 @@ def get_metadata():
 
 
 api.include_router(school.router)
+api.include_router(change_queries.router)
+api.include_router(admin.router)
+api.include_router(metrics.router)
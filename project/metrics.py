@@ -0,0 +1,355 @@
+import bisect
+import threading
+import time
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import access_log
+from pymongo import monitoring
+
+# seconds
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+# items
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+# bytes
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+Labels = Tuple[str, ...]
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def label_text(names: Sequence[str], values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def expose(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for labels, value in list(self.values.items()):
+            yield f"{self.name}{label_text(self.labels, labels)} {value}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram; observe is a bisect and two additions
+    Buckets are stored per bucket and made cumulative when exposed
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last is +Inf), sum]
+        self.values: Dict[Labels, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.values.get(labels)
+            if series is None:
+                series = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def expose(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, (counts, total) in list(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), list(counts)):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                text = label_text(self.labels, labels, f'le="{le}"')
+                yield f"{self.name}_bucket{text} {cumulative}"
+            text = label_text(self.labels, labels)
+            yield f"{self.name}_sum{text} {total}"
+            yield f"{self.name}_count{text} {cumulative}"
+
+
+registry: List[Counter | Histogram] = []
+
+
+def register(metric):
+    registry.append(metric)
+    return metric
+
+
+http_requests = register(
+    Counter(
+        "http_requests_total",
+        "HTTP requests by route template, method and status",
+        ("route", "method", "status"),
+    )
+)
+http_latency = register(
+    Histogram(
+        "http_request_duration_seconds",
+        "HTTP request latency by route template, method and status",
+        ("route", "method", "status"),
+    )
+)
+http_in_flight = register(
+    Gauge("http_requests_in_flight", "HTTP requests being served", ())
+)
+http_response_size = register(
+    Histogram(
+        "http_response_size_bytes",
+        "HTTP response body size by route template",
+        ("route", "method"),
+        SIZE_BUCKETS,
+    )
+)
+mongo_latency = register(
+    Histogram(
+        "mongodb_command_duration_seconds",
+        "MongoDB command latency by command, collection and outcome",
+        ("command", "collection", "outcome"),
+    )
+)
+mongo_checkout_wait = register(
+    Histogram(
+        "mongodb_pool_checkout_wait_seconds",
+        "Time spent waiting for a pooled connection",
+        ("outcome",),
+    )
+)
+mongo_slow_commands = register(
+    Counter(
+        "mongodb_slow_commands_total",
+        "MongoDB commands over the slow query threshold",
+        ("command", "collection"),
+    )
+)
+mongo_collection_scans = register(
+    Counter(
+        "mongodb_collection_scans_total",
+        "Slow queries explained as collection scans",
+        ("collection",),
+    )
+)
+
+coalescer_wait = register(
+    Histogram(
+        "write_coalescer_wait_seconds",
+        "Time a write waited to join a batch",
+        ("coalescer",),
+    )
+)
+coalescer_batch = register(
+    Histogram(
+        "write_coalescer_batch_size",
+        "Writes sent in one batch",
+        ("coalescer",),
+        BATCH_BUCKETS,
+    )
+)
+admission_active = register(
+    Gauge(
+        "admission_active_requests",
+        "Admitted requests being served by route class",
+        ("route_class",),
+    )
+)
+admission_queue_depth = register(
+    Gauge(
+        "admission_queue_depth",
+        "Requests waiting for admission by route class",
+        ("route_class",),
+    )
+)
+admission_wait = register(
+    Histogram(
+        "admission_wait_seconds",
+        "Time queued requests waited for admission",
+        ("route_class",),
+    )
+)
+admission_shed = register(
+    Counter(
+        "admission_shed_total",
+        "Requests answered with 503 by route class and reason",
+        ("route_class", "reason"),
+    )
+)
+
+
+def exposition() -> str:
+    lines = []
+    for metric in registry:
+        lines.extend(metric.expose())
+    return "\n".join(lines) + "\n"
+
+
+def route_template(scope: dict) -> str:
+    """Path template of the matched route, so ids do not explode cardinality"""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request counts, latency and response sizes
+    Sits outside the app so every response, errors included, is measured
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = "500"
+        size = 0
+
+        async def measured_send(message) -> None:
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        http_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, measured_send)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_in_flight.dec()
+            route = route_template(scope)
+            method = scope["method"]
+            http_requests.inc(route, method, status)
+            http_latency.observe(elapsed, route, method, status)
+            http_response_size.observe(size, route, method)
+
+
+class CommandTimer(monitoring.CommandListener):
+    """
+    Times MongoDB commands as reported by the driver
+    Callbacks run on Motor's executor threads, hence the locked metrics;
+    they run in a copy of the request's context, so time is also added to
+    the request's access log entry
+    """
+
+    def __init__(self) -> None:
+        self._collections: Dict[Tuple, str] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        collection = event.command.get(event.command_name)
+        if isinstance(collection, str):
+            self._collections[(event.connection_id, event.request_id)] = collection
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._observe(event, "success")
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._observe(event, "failure")
+
+    def _observe(self, event, outcome: str) -> None:
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        seconds = event.duration_micros / 1_000_000
+        mongo_latency.observe(seconds, event.command_name, collection, outcome)
+        access_log.add_mongo_time(seconds)
+
+
+class CheckoutTimer(monitoring.ConnectionPoolListener):
+    """
+    Times connection checkouts; start and end fire on the same thread
+    """
+
+    def __init__(self) -> None:
+        self._local = threading.local()
+
+    def connection_check_out_started(self, event) -> None:
+        self._local.start = time.perf_counter()
+
+    def connection_checked_out(self, event) -> None:
+        self._observe("success")
+
+    def connection_check_out_failed(self, event) -> None:
+        self._observe(event.reason)
+
+    def _observe(self, outcome: str) -> None:
+        start = getattr(self._local, "start", None)
+        if start is not None:
+            mongo_checkout_wait.observe(time.perf_counter() - start, outcome)
+            self._local.start = None
+
+    def pool_created(self, event) -> None:
+        pass
+
+    def pool_ready(self, event) -> None:
+        pass
+
+    def pool_cleared(self, event) -> None:
+        pass
+
+    def pool_closed(self, event) -> None:
+        pass
+
+    def connection_created(self, event) -> None:
+        pass
+
+    def connection_ready(self, event) -> None:
+        pass
+
+    def connection_closed(self, event) -> None:
+        pass
+
+    def connection_checked_in(self, event) -> None:
+        pass
+
+
+def event_listeners() -> list:
+    return [CommandTimer(), CheckoutTimer()]
@@ -0,0 +1,245 @@
+import fcntl
+import gzip
+import hashlib
+import mmap
+import os
+import struct
+import time
+
+import brotli
+from cache import TTLCache
+
+GZIP = "gzip"
+BROTLI = "br"
+
+# bodies smaller than this are not worth compressing
+MIN_COMPRESS_BYTES = 1024
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    """
+    Picks brotli, then gzip, from an Accept-Encoding header
+    Codings refused with q=0 are skipped
+    """
+    accepted = set()
+    for coding in accept_encoding.lower().split(","):
+        name, *params = coding.split(";")
+        quality = 1.0
+        for param in params:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(name.strip())
+    for encoding in (BROTLI, GZIP):
+        if encoding in accepted:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == BROTLI:
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+class LocalStore:
+    """
+    Byte-bounded store private to this process
+    """
+
+    def __init__(self, maxsize: int, maxbytes: int, ttl: float) -> None:
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl, maxweight=maxbytes, weigh=len)
+
+    def generation(self) -> int:
+        return self.cache.generation
+
+    def get(self, key: bytes) -> bytes | None:
+        return self.cache.get(key)
+
+    def set(self, key: bytes, value: bytes, generation: int) -> None:
+        self.cache.set(key, value, generation)
+
+    def clear(self) -> None:
+        self.cache.clear()
+
+    def stats(self) -> dict:
+        return {"store": "local", **self.cache.stats()}
+
+
+class SharedStore:
+    """
+    Byte-bounded store shared by every worker on the host
+    Entries are files in a tmpfs directory such as /dev/shm, so reads are
+    memory copies; a generation counter in a mapped file invalidates all
+    workers at once, since entries are named after the generation they
+    were filled in
+    """
+
+    def __init__(self, directory: str, maxbytes: int, ttl: float) -> None:
+        self.directory = directory
+        self.maxbytes = maxbytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._written = 0
+        os.makedirs(directory, exist_ok=True)
+        self._counter = os.open(
+            os.path.join(directory, "generation"), os.O_RDWR | os.O_CREAT
+        )
+        if os.fstat(self._counter).st_size < 8:
+            os.ftruncate(self._counter, 8)
+        self._generation = mmap.mmap(self._counter, 8)
+
+    def generation(self) -> int:
+        return struct.unpack_from("Q", self._generation)[0]
+
+    def path(self, key: bytes, generation: int) -> str:
+        name = hashlib.blake2b(key, digest_size=16).hexdigest()
+        return os.path.join(self.directory, f"{generation}-{name}")
+
+    def get(self, key: bytes) -> bytes | None:
+        path = self.path(key, self.generation())
+        try:
+            with open(path, "rb") as entry:
+                if os.fstat(entry.fileno()).st_mtime + self.ttl < time.time():
+                    raise FileNotFoundError
+                value = entry.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def set(self, key: bytes, value: bytes, generation: int) -> None:
+        if generation != self.generation():
+            return
+        path = self.path(key, generation)
+        # written under a hidden name, then renamed into place atomically
+        partial = os.path.join(
+            self.directory, f".{os.path.basename(path)}.{os.getpid()}"
+        )
+        with open(partial, "wb") as entry:
+            entry.write(value)
+        os.replace(partial, path)
+        self._written += len(value)
+        if self._written > self.maxbytes // 8:
+            self._written = 0
+            self.sweep()
+
+    def clear(self) -> None:
+        fcntl.flock(self._counter, fcntl.LOCK_EX)
+        try:
+            struct.pack_into("Q", self._generation, 0, self.generation() + 1)
+        finally:
+            fcntl.flock(self._counter, fcntl.LOCK_UN)
+        self.invalidations += 1
+
+    def sweep(self) -> None:
+        """
+        Removes entries of older generations, then the oldest entries until
+        the store fits in maxbytes
+        """
+        current = f"{self.generation()}-"
+        expired = time.time() - self.ttl
+        kept = []
+        for entry in os.scandir(self.directory):
+            if entry.name == "generation" or entry.name.startswith("."):
+                continue
+            try:
+                stat = entry.stat()
+                if not entry.name.startswith(current) or stat.st_mtime < expired:
+                    os.unlink(entry.path)
+                    continue
+            except FileNotFoundError:
+                continue
+            kept.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in kept)
+        for _, size, path in sorted(kept):
+            if total <= self.maxbytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        return {
+            "store": "shared",
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+class PageCache:
+    """
+    Encoded response bodies with their compressed variants
+    A variant is compressed on the first request accepting it, then reused
+    """
+
+    def __init__(self, store: LocalStore | SharedStore) -> None:
+        self.store = store
+
+    def generation(self) -> int:
+        return self.store.generation()
+
+    def get(self, key: bytes, accept_encoding: str) -> tuple | None:
+        """Returns (body, content encoding or None) when the page is cached"""
+        generation = self.store.generation()
+        encoding = choose_encoding(accept_encoding)
+        if encoding:
+            variant = self.store.get(key + b"|" + encoding.encode())
+            if variant is not None:
+                return variant, encoding
+        body = self.store.get(key)
+        if body is None:
+            return None
+        return self.variant(key, body, encoding, generation)
+
+    def set(
+        self, key: bytes, body: bytes, accept_encoding: str, generation: int
+    ) -> tuple:
+        """Stores a freshly encoded page and returns it as get would"""
+        self.store.set(key, body, generation)
+        return self.variant(key, body, choose_encoding(accept_encoding), generation)
+
+    def variant(
+        self, key: bytes, body: bytes, encoding: str | None, generation: int
+    ) -> tuple:
+        if not encoding or len(body) < MIN_COMPRESS_BYTES:
+            return body, None
+        compressed = compress(body, encoding)
+        self.store.set(key + b"|" + encoding.encode(), compressed, generation)
+        return compressed, encoding
+
+    def clear(self) -> None:
+        self.store.clear()
+
+    def stats(self) -> dict:
+        return self.store.stats()
+
+
+def page_cache_from_env(name: str) -> PageCache | None:
+    """
+    PAGE_CACHE_STORE is local (default), shared or off
+    Shared stores keep each resource's pages in its own subdirectory
+    """
+    kind = os.environ.get("PAGE_CACHE_STORE", "local").lower()
+    maxbytes = int(os.environ.get("PAGE_CACHE_BYTES", 64 * 1024 * 1024))
+    ttl = float(os.environ.get("PAGE_CACHE_TTL", 30))
+    if kind == "off":
+        return None
+    if kind == "shared":
+        directory = os.environ.get("PAGE_CACHE_DIR", "/dev/shm/edfi-page-cache")
+        return PageCache(SharedStore(os.path.join(directory, name), maxbytes, ttl))
+    maxsize = int(os.environ.get("PAGE_CACHE_SIZE", 1024))
+    return PageCache(LocalStore(maxsize, maxbytes, ttl))
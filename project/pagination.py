@@ -0,0 +1,31 @@
+import base64
+import binascii
+import json
+
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException
+
+
+def encode_cursor(last_id: ObjectId) -> str:
+    """
+    Builds the opaque next-page token for keyset pagination
+    The token carries the _id of the last document on the page
+    """
+    payload = json.dumps({"after": str(last_id)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> ObjectId | None:
+    """
+    Reads a token produced by encode_cursor
+    An empty token starts from the first page
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return ObjectId(payload["after"])
+    except (binascii.Error, ValueError, KeyError, TypeError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
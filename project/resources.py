@@ -0,0 +1,947 @@
+import asyncio
+import inspect
+import os
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, Type
+
+import database
+import orjson
+from bson.objectid import ObjectId
+from bulk import ERROR, bulk_upsert
+from cache import TTLCache
+from change_queries import change_version_filter, change_versions
+from coalescer import WriteCoalescer
+from descriptors import compact, compact_filters, is_descriptor, registry
+from etags import etag, etag_matches, if_match_filter
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    status,
+)
+from fastapi.responses import Response, StreamingResponse
+from logger import logger
+from motor.motor_asyncio import AsyncIOMotorCollection
+from page_cache import page_cache_from_env
+from pagination import decode_cursor, encode_cursor
+from pydantic import BaseModel, ValidationError
+from pydantic.fields import ModelField
+from pymongo import ASCENDING, IndexModel, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure, PyMongoError, WriteError
+from serializers import DocumentSerializer, content_hash
+from snapshots import no_snapshot, register, snapshot_collection, snapshot_identifier
+from streaming import NDJSON, stream_documents, streaming_media_type
+from upserts import merge_patch, update_diff, upsert_pipeline
+from validation import validator_from_env
+
+stream_batch_size = int(os.environ.get("STREAM_BATCH_SIZE", 500))
+bulk_batch_size = int(os.environ.get("BULK_BATCH_SIZE", 1000))
+# concurrent single-record writes are batched; a window of 0 writes each alone
+coalesce_window = float(os.environ.get("WRITE_COALESCE_WINDOW_MS", 2)) / 1000
+coalesce_max_batch = int(os.environ.get("WRITE_COALESCE_MAX_BATCH", 100))
+
+responses = {
+    200: {"description": "The resource was updated."},
+    201: {"description": "The resource was created."},
+    400: {
+        "description": "Bad Request. The request was invalid and cannot be completed. See the response body for specific validation errors. This will typically be an issue with the query parameters or their values."
+    },
+    401: {
+        "description": "Unauthorized. The request requires authentication. The OAuth bearer token was either not provided or is invalid. The operation may succeed once authentication has been successfully completed."
+    },
+    403: {
+        "description": "Forbidden. The request cannot be completed in the current authorization context. Contact your administrator if you believe this operation should be allowed."
+    },
+    405: {
+        "description": "Method Is Not Allowed. When the Snapshot-Identifier header is present the method is not allowed."
+    },
+    409: {
+        "description": "Conflict. The request cannot be completed because it would result in an invalid state. See the response body for details."
+    },
+    412: {
+        "description": "The resource's current server-side ETag value does not match the supplied If-Match header value in the request. This indicates the resource has been modified by another consumer."
+    },
+    500: {
+        "description": "An unhandled error occurred on the server. See the response body for details."
+    },
+}
+
+# every resource built, for startup, shutdown and the admin endpoints
+resources: List["Resource"] = []
+
+
+def camel(name: str) -> str:
+    head, *rest = name.split("_")
+    return head + "".join(part[:1].upper() + part[1:] for part in rest)
+
+
+def model_field(model: Type[BaseModel], path: str) -> ModelField:
+    """Field at a dotted stored path, walking into nested models"""
+    *parents, leaf = path.split(".")
+    for name in parents:
+        model = model.__fields__[name].type_
+    return model.__fields__[leaf]
+
+
+def page_response(body: bytes, encoding: str | None, headers) -> Response:
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+class Resource:
+    """
+    Ed-Fi resource served from one collection, described by its models,
+    natural key and search parameters
+
+    Everything derived from that description (alias and storage maps,
+    search parameter to index map, serializers, caches, the router) is
+    built once here, so requests only look things up
+
+    name: collection, path and tag, e.g. schools
+    singular: used in messages, operation ids and settings, e.g. school
+    filters: search parameter -> stored path; top-level fields keep their
+    alias, nested ones are named after the parameter
+    filter_descriptions: overrides the model's description of a parameter
+    compound_indexes: extra indexes over search parameters used together
+    """
+
+    def __init__(
+        self,
+        name: str,
+        singular: str,
+        model: Type[BaseModel],
+        create_model: Type[BaseModel],
+        update_model: Type[BaseModel],
+        key: str,
+        filters: Dict[str, str],
+        filter_descriptions: Dict[str, str] | None = None,
+        compound_indexes: List[Tuple[str, ...]] = (),
+    ) -> None:
+        self.name = name
+        self.singular = singular
+        self.model = model
+        self.create_model = create_model
+        self.update_model = update_model
+        # payload -> stored fields, compiled from the models unless disabled
+        self.create_validator = validator_from_env(create_model)
+        self.update_validator = validator_from_env(update_model)
+        self.key = key
+        self.key_alias = model.__fields__[key].alias
+        self.not_found = f"{singular.capitalize()} not found."
+
+        # search parameter -> (stored path, type, alias, description)
+        descriptions = filter_descriptions or {}
+        self.filters = {}
+        for parameter, path in filters.items():
+            field = model_field(model, path)
+            alias = field.alias if "." not in path else camel(parameter)
+            self.filters[parameter] = (
+                path,
+                field.type_,
+                alias,
+                descriptions.get(parameter, field.field_info.description),
+            )
+        self.descriptor_paths = [
+            path for path in filters.values() if is_descriptor(path)
+        ]
+
+        # the natural key every upsert matches on, then the search parameters;
+        # these end in _id so filtered keyset pages avoid a sort
+        self.indexes = [
+            IndexModel([(key, ASCENDING)], unique=True),
+            *[
+                IndexModel([(path, ASCENDING), ("_id", ASCENDING)])
+                for path in filters.values()
+                if path != key
+            ],
+            *[
+                IndexModel([(filters[parameter], ASCENDING) for parameter in group])
+                for group in compound_indexes
+            ],
+            IndexModel([("change_version", ASCENDING), ("_id", ASCENDING)]),
+        ]
+        register(name, self.indexes)
+
+        self.serializer = DocumentSerializer(model)
+        # filtered Total-Count results, dropped on every write
+        self.count_cache = TTLCache(
+            maxsize=int(os.environ.get("TOTAL_COUNT_CACHE_SIZE", 1024)),
+            ttl=float(os.environ.get("TOTAL_COUNT_CACHE_TTL", 30)),
+        )
+        # serialized GET by id bodies and their hashes, keyed on id
+        prefix = singular.upper()
+        self.item_cache = TTLCache(
+            maxsize=int(os.environ.get(f"{prefix}_CACHE_SIZE", 10000)),
+            ttl=float(os.environ.get(f"{prefix}_CACHE_TTL", 60)),
+            maxweight=int(os.environ.get(f"{prefix}_CACHE_BYTES", 64 * 1024 * 1024)),
+            weigh=lambda entry: len(entry[0]),
+        )
+        # keeps the item cache coherent across uvicorn workers
+        self.change_stream = (
+            os.environ.get(f"{prefix}_CACHE_CHANGE_STREAM", "false").lower() == "true"
+        )
+        # encoded list pages, keyed on the normalized query
+        self.page_cache = page_cache_from_env(name)
+        self.writes = (
+            WriteCoalescer(
+                name,
+                self.upsert_many,
+                coalesce_window,
+                coalesce_max_batch,
+                key=lambda document: document[self.key],
+            )
+            if coalesce_window > 0
+            else None
+        )
+        self.filter_dependency = self.build_filter_dependency()
+        self.fields_dependency = self.build_fields_dependency()
+        self.router = self.build_router()
+        resources.append(self)
+
+    async def create_indexes(self) -> None:
+        """
+        Creates the indexes backing the natural key and search parameters
+        Logs any index that could not be built instead of failing startup
+        """
+        try:
+            await database.collection(self.name).create_indexes(self.indexes)
+        except OperationFailure as e:
+            logger.error(f"Unable to create {self.singular} indexes: {e}")
+        existing = await database.collection(self.name).index_information()
+        for index in self.indexes:
+            if index.document["name"] not in existing:
+                logger.warning(
+                    f"Missing {self.singular} index: {index.document['name']}"
+                )
+        await database.collection(f"{self.name}_deletes").create_index("change_version")
+
+    async def watch_changes(self) -> None:
+        """
+        Drops cached entries for items written by other processes
+        Needs a replica set; reconnects after errors until cancelled
+        """
+        while True:
+            try:
+                async with database.collection(self.name).watch() as stream:
+                    async for change in stream:
+                        self.item_cache.delete(str(change["documentKey"]["_id"]))
+                        self.clear_list_caches()
+            except PyMongoError as e:
+                logger.error(f"{self.singular.capitalize()} change stream failed: {e}")
+                # anything cached while the stream was down may be stale
+                self.item_cache.clear()
+                await asyncio.sleep(5)
+
+    def clear_list_caches(self) -> None:
+        """Drops cached counts and list pages once the collection changes"""
+        self.count_cache.clear()
+        if self.page_cache:
+            self.page_cache.clear()
+
+    def cache_stats(self) -> dict:
+        return {
+            "items": self.item_cache.stats(),
+            "totalCount": self.count_cache.stats(),
+            "pages": self.page_cache.stats() if self.page_cache else None,
+        }
+
+    async def read_collection(self, snapshot: str | None) -> AsyncIOMotorCollection:
+        """The live collection, or its copy in the requested snapshot"""
+        if snapshot is None:
+            return database.read_collection(self.name)
+        return await snapshot_collection(snapshot, self.name)
+
+    async def count(
+        self, filters: dict, collection: AsyncIOMotorCollection | None = None
+    ) -> int:
+        """
+        Unfiltered counts come from collection metadata
+        Filtered counts run against the search indexes and are cached per filter;
+        like every cache writes clear, they are filled from the primary
+        A snapshot's collection is passed in and counted without the cache
+        """
+        if collection is not None:
+            if not filters:
+                return await collection.estimated_document_count()
+            return await collection.count_documents(filters)
+        if not filters:
+            return await database.read_collection(self.name).estimated_document_count()
+        key = orjson.dumps(filters, option=orjson.OPT_SORT_KEYS)
+        count = self.count_cache.get(key)
+        if count is None:
+            count = await database.collection(self.name).count_documents(filters)
+            self.count_cache.set(key, count)
+        return count
+
+    def object_id(self, id: str) -> ObjectId:
+        """The _id an id path parameter names; 404 when it cannot name one"""
+        if not ObjectId.is_valid(id):
+            raise HTTPException(status_code=404, detail=self.not_found)
+        return ObjectId(id)
+
+    def document(self, document: dict) -> dict:
+        """
+        Completes the stored form of a validated item
+        The content hash covers everything but last_modified_date
+        """
+        document["content_hash"] = content_hash(document)
+        document["last_modified_date"] = datetime.utcnow()
+        return document
+
+    async def upsert_many(self, documents: List[dict]) -> list:
+        """
+        Flushes single-record writes gathered by the coalescer: one counter
+        call, one unordered bulk write and one read back for the whole batch
+        Returns (stored document, created) or the write's error per document
+        """
+        new_ids = [ObjectId() for _ in documents]
+        errors = {}
+        upserted = {}
+        async with change_versions(database.get_database(), len(documents)) as newest:
+            operations = []
+            for position, (document, new_id) in enumerate(zip(documents, new_ids)):
+                document["change_version"] = newest - len(documents) + 1 + position
+                operations.append(
+                    UpdateOne(
+                        {self.key: document[self.key]},
+                        upsert_pipeline(document, new_id),
+                        upsert=True,
+                    )
+                )
+            try:
+                result = await database.collection(self.name).bulk_write(
+                    operations, ordered=False
+                )
+                upserted = result.upserted_ids
+            except BulkWriteError as e:
+                errors = {error["index"]: error for error in e.details["writeErrors"]}
+                upserted = {u["index"]: u["_id"] for u in e.details["upserted"]}
+        keys = [document[self.key] for document in documents]
+        stored = {
+            record[self.key]: record
+            async for record in database.collection(self.name).find(
+                {self.key: {"$in": keys}}
+            )
+        }
+        results = []
+        for position, (document, new_id) in enumerate(zip(documents, new_ids)):
+            if position in errors:
+                error = errors[position]
+                results.append(WriteError(error["errmsg"], error["code"], error))
+                continue
+            record = stored.get(document[self.key])
+            if record is None:
+                # deleted before the read back; the write itself landed
+                results.append(({**document, "_id": new_id}, position in upserted))
+                continue
+            if record["content_hash"] != document["content_hash"]:
+                # another write to the record landed before the read back
+                record = {**document, "_id": record["_id"]}
+            results.append((record, record["_id"] == new_id))
+        return results
+
+    async def upsert(self, document: dict, if_match: str | None) -> Tuple[dict, bool]:
+        """
+        Upserts on the natural key and reads the stored document back
+        Returns the stored document and whether it was created
+        """
+        if self.writes and not if_match:
+            return await self.writes.submit(document)
+        query = {self.key: document[self.key]}
+        if if_match:
+            query.update(if_match_filter(if_match))
+        new_id = ObjectId()
+        async with change_versions(database.get_database()) as version:
+            document["change_version"] = version
+            stored = await database.collection(self.name).find_one_and_update(
+                filter=query,
+                update=upsert_pipeline(document, new_id),
+                upsert=not if_match,
+                return_document=ReturnDocument.AFTER,
+            )
+        if stored is None:
+            raise HTTPException(
+                status_code=status.HTTP_412_PRECONDITION_FAILED,
+                detail="The resource has been modified by another consumer.",
+            )
+        return stored, stored["_id"] == new_id
+
+    async def update(
+        self,
+        oid: ObjectId,
+        build: Callable[[dict], Awaitable[dict]],
+        if_match: str | None,
+    ) -> Response:
+        """
+        Writes only the fields that differ between the stored document and
+        the one build makes from it
+        A document with nothing changed is not written at all
+        The write is conditional on the content it was diffed against; when
+        another write lands first the document is rebuilt from the new
+        content and diffed again, or 412 with If-Match
+        """
+        collection = database.collection(self.name)
+        while True:
+            stored = await collection.find_one({"_id": oid})
+            if not stored:
+                raise HTTPException(status_code=404, detail=self.not_found)
+            if if_match and not etag_matches(if_match, stored.get("content_hash")):
+                raise HTTPException(
+                    status_code=status.HTTP_412_PRECONDITION_FAILED,
+                    detail="The resource has been modified by another consumer.",
+                )
+            document = await build(stored)
+            if stored[self.key] != document[self.key]:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"The value of {self.key_alias} cannot be changed.",
+                )
+            update = update_diff(stored, document)
+            if not update:
+                break
+            async with change_versions(database.get_database()) as version:
+                update.setdefault("$set", {}).update(
+                    change_version=version,
+                    last_modified_date=document["last_modified_date"],
+                )
+                result = await collection.update_one(
+                    {"_id": oid, "content_hash": stored.get("content_hash")}, update
+                )
+            if result.matched_count:
+                self.clear_list_caches()
+                self.item_cache.delete(str(oid))
+                break
+        return Response(
+            status_code=status.HTTP_204_NO_CONTENT,
+            headers={"ETag": etag(document["content_hash"])},
+        )
+
+    def build_filter_dependency(self):
+        """
+        Dependency taking the search parameters of the 'Get' search pattern
+        Returns a mongo filter keyed on the stored snake_case paths, with
+        descriptors resolved to their stored ids
+        """
+        paths = {parameter: spec[0] for parameter, spec in self.filters.items()}
+
+        async def filters(**values) -> dict:
+            found = {
+                paths[parameter]: value
+                for parameter, value in values.items()
+                if value is not None
+            }
+            return await compact_filters(found, self.descriptor_paths)
+
+        filters.__signature__ = inspect.Signature(
+            [
+                inspect.Parameter(
+                    parameter,
+                    inspect.Parameter.KEYWORD_ONLY,
+                    default=Query(default=None, alias=alias, description=description),
+                    annotation=Optional[type_],
+                )
+                for parameter, (_, type_, alias, description) in self.filters.items()
+            ],
+            return_annotation=dict,
+        )
+        return filters
+
+    def build_fields_dependency(self):
+        """
+        Dependency returning the mongo projection and serializer for the
+        fields requested
+        """
+        example = ",".join(alias for _, alias, _, _ in self.serializer.table[:3])
+        serializer = self.serializer
+
+        def fields_selection(
+            fields: str
+            | None = Query(
+                default=None,
+                description=f"Comma-separated list of the properties to return, e.g. '{example}'. Nested properties are addressed with dots. The id is always returned.",
+            ),
+        ) -> Tuple[dict | None, DocumentSerializer]:
+            if not fields:
+                return None, serializer
+            try:
+                return serializer.project(fields)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+        return fields_selection
+
+    def build_router(self) -> APIRouter:
+        resource = self
+        model = self.model
+        path = f"/{self.name}"
+        tags = [self.name]
+        singular = self.singular
+        serializer = self.serializer
+
+        router = APIRouter()
+
+        @router.post(
+            path,
+            name=f"create_{singular}",
+            response_model=model,
+            responses={**responses},
+            tags=tags,
+            dependencies=[Depends(no_snapshot)],
+            openapi_extra=self.create_validator.openapi(),
+        )
+        async def create(
+            request: Request,
+            if_match: str | None = Header(default=None),
+        ) -> Response:
+            """
+            Upserts on the natural key and returns the stored resource
+            Re-posting identical content is a 200 no-op
+            With If-Match only a stored resource carrying that ETag is replaced
+            Concurrent posts without If-Match share a bulk write
+            """
+            document = resource.document(await resource.create_validator.body(request))
+            await compact([document], serializer.table)
+            stored, created = await resource.upsert(document, if_match)
+            resource.clear_list_caches()
+            resource.item_cache.delete(str(stored["_id"]))
+            return Response(
+                status_code=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+                content=await serializer.encode(stored),
+                media_type="application/json",
+                headers={"ETag": etag(stored["content_hash"])},
+            )
+
+        @router.post(
+            f"{path}/bulk",
+            name=f"bulk_create_{self.name}",
+            responses={**responses},
+            tags=tags,
+            dependencies=[Depends(no_snapshot)],
+        )
+        async def bulk_create(request: Request) -> Response:
+            """
+            Accepts a json array, or ndjson with Content-Type application/x-ndjson
+            Validates each record and upserts the valid ones in unordered
+            batches keyed on the natural key
+            Returns one result per record: created, updated, unchanged or error
+            """
+            body = await request.body()
+            records = []
+            if NDJSON in request.headers.get("content-type", ""):
+                for line in body.splitlines():
+                    if not line.strip():
+                        continue
+                    try:
+                        records.append(orjson.loads(line))
+                    except orjson.JSONDecodeError as e:
+                        records.append(e)
+            else:
+                try:
+                    records = orjson.loads(body)
+                except orjson.JSONDecodeError:
+                    raise HTTPException(status_code=400, detail="Invalid JSON body.")
+                if not isinstance(records, list):
+                    raise HTTPException(
+                        status_code=400, detail="Expected a JSON array."
+                    )
+
+            results = [None] * len(records)
+            # the last record for a key wins, as it would posted one at a time
+            documents = {}
+            for index, record in enumerate(records):
+                if isinstance(record, Exception):
+                    results[index] = {"status": ERROR, "errors": [str(record)]}
+                    continue
+                try:
+                    fields = resource.create_validator.parse(record)
+                except ValidationError as e:
+                    results[index] = {"status": ERROR, "errors": e.errors()}
+                    continue
+                key = fields[resource.key]
+                if key in documents:
+                    results[documents[key][0]] = {
+                        "status": ERROR,
+                        "errors": [
+                            f"Superseded by a later record with the same {resource.key_alias}."
+                        ],
+                    }
+                documents[key] = (index, resource.document(fields))
+
+            pending = list(documents.values())
+            await compact([document for _, document in pending], serializer.table)
+            for start in range(0, len(pending), bulk_batch_size):
+                batch = pending[start : start + bulk_batch_size]
+                stored = await bulk_upsert(
+                    database.collection(resource.name), batch, resource.key
+                )
+                for index, result in stored.items():
+                    results[index] = result
+                    if result.get("id"):
+                        resource.item_cache.delete(str(result["id"]))
+            if pending:
+                resource.clear_list_caches()
+
+            content = [
+                {"index": index, **result} for index, result in enumerate(results)
+            ]
+            return Response(
+                content=orjson.dumps(content, default=str),
+                media_type="application/json",
+            )
+
+        @router.get(f"{path}/deletes", name=f"list_{singular}_deletes", tags=tags)
+        async def list_deletes(
+            offset: int = Query(
+                default=0,
+                description="Indicates how many items should be skipped before returning results.",
+            ),
+            limit: int = Query(
+                default=2500,
+                description="Indicates the maximum number of items that should be returned in the results.",
+            ),
+            change_versions: dict = Depends(change_version_filter),
+        ) -> Response:
+            """
+            Returns the tombstones of deleted resources in change version order
+            """
+            tombstones = (
+                await database.read_collection(f"{resource.name}_deletes")
+                .find(change_versions)
+                .sort("change_version", ASCENDING)
+                .skip(offset)
+                .limit(limit)
+                .to_list(limit)
+            )
+            content = [
+                {
+                    "id": tombstone["_id"],
+                    "changeVersion": tombstone["change_version"],
+                    "keyValues": tombstone["key_values"],
+                }
+                for tombstone in tombstones
+            ]
+            return Response(
+                content=orjson.dumps(content, default=str),
+                media_type="application/json",
+            )
+
+        @router.get(f"{path}/export", name=f"export_{self.name}", tags=tags)
+        async def export(
+            snapshot: str | None = Depends(snapshot_identifier),
+        ) -> StreamingResponse:
+            """
+            Streams every resource as ndjson in a single unsorted pass over the
+            collection, or over a snapshot's copy for a consistent extract
+            """
+            collection = await resource.read_collection(snapshot)
+            return StreamingResponse(
+                stream_documents(
+                    collection.find(), serializer.encode, NDJSON, stream_batch_size
+                ),
+                media_type=NDJSON,
+            )
+
+        @router.get(
+            f"{path}/{{id}}", name=f"get_{singular}", response_model=model, tags=tags
+        )
+        async def get(
+            id: str,
+            if_none_match: str | None = Header(default=None),
+            selection: Tuple[dict | None, DocumentSerializer] = Depends(
+                self.fields_dependency
+            ),
+            snapshot: str | None = Depends(snapshot_identifier),
+        ) -> Response:
+            """
+            Serves cached bodies when possible
+            Returns 304 when If-None-Match still matches, reading only the stored hash
+            Partial documents requested with fields bypass the cache and ETags
+            Snapshot reads bypass the cache
+            """
+            oid = resource.object_id(id)
+            projection, selected = selection
+            collection = await resource.read_collection(snapshot)
+            if projection:
+                result = await collection.find_one({"_id": oid}, projection)
+                if not result:
+                    raise HTTPException(status_code=404, detail=resource.not_found)
+                return Response(
+                    content=await selected.encode(result), media_type="application/json"
+                )
+
+            cache = resource.item_cache
+            cached = cache.get(str(oid)) if snapshot is None else None
+            if snapshot is None and cache.maxsize:
+                # a lagging secondary would cache content older than the
+                # writes that just cleared it
+                collection = database.collection(resource.name)
+            if cached is None and if_none_match:
+                current = await collection.find_one({"_id": oid}, {"content_hash": 1})
+                if not current:
+                    raise HTTPException(status_code=404, detail=resource.not_found)
+                if etag_matches(if_none_match, current.get("content_hash")):
+                    return Response(
+                        status_code=status.HTTP_304_NOT_MODIFIED,
+                        headers={"ETag": etag(current["content_hash"])},
+                    )
+            if cached is None:
+                generation = cache.generation
+                result = await collection.find_one({"_id": oid})
+                if not result:
+                    raise HTTPException(status_code=404, detail=resource.not_found)
+                cached = (await serializer.encode(result), result.get("content_hash"))
+                if snapshot is None:
+                    cache.set(str(oid), cached, generation)
+
+            body, stored_hash = cached
+            headers = {"ETag": etag(stored_hash)} if stored_hash else {}
+            if if_none_match and etag_matches(if_none_match, stored_hash):
+                return Response(
+                    status_code=status.HTTP_304_NOT_MODIFIED, headers=headers
+                )
+            return Response(
+                content=body, media_type="application/json", headers=headers
+            )
+
+        @router.get(
+            path,
+            name=f"list_{self.name}",
+            response_model=List[model],
+            tags=tags,
+            description="This GET operation provides access to resources using the 'Get' search pattern. The values of any properties of the resource that are specified will be used to return all matching results (if it exists).",
+        )
+        async def list_items(
+            request: Request,
+            response: Response,
+            offset: int = Query(
+                default=0,
+                description="Indicates how many items should be skipped before returning results.",
+            ),
+            limit: int = Query(
+                default=2500,
+                description="Indicates the maximum number of items that should be returned in the results.",
+            ),
+            total_count: bool = Query(
+                default=False,
+                alias="totalCount",
+                description="Indicates if the total number of items available should be returned in the 'Total-Count' header of the response. If set to false, 'Total-Count' header will not be provided.",
+            ),
+            cursor: str
+            | None = Query(
+                default=None,
+                description="Opaque token from the 'Next-Cursor' header of the previous page. Pass an empty value to start keyset paging from the first page; when present, offset is ignored.",
+            ),
+            stream: str
+            | None = Query(
+                default=None,
+                regex="^(json|ndjson)$",
+                description="Streams the results as they are read instead of buffering the page: 'ndjson' for newline-delimited JSON, 'json' for a chunked JSON array. 'Accept: application/x-ndjson' selects 'ndjson'. The 'Next-Cursor' header is not provided for streamed responses.",
+            ),
+            filters: dict = Depends(self.filter_dependency),
+            change_versions: dict = Depends(change_version_filter),
+            selection: Tuple[dict | None, DocumentSerializer] = Depends(
+                self.fields_dependency
+            ),
+            snapshot: str | None = Depends(snapshot_identifier),
+        ) -> Response:
+            projection, selected = selection
+            filters = {**filters, **change_versions}
+            collection = await resource.read_collection(snapshot)
+            if total_count:
+                response.headers["Total-Count"] = str(
+                    await resource.count(filters, collection if snapshot else None)
+                )
+
+            page_cache = resource.page_cache
+            media_type = streaming_media_type(stream, request)
+            page_key = None
+            if page_cache and snapshot is None and cursor is None and not media_type:
+                page_key = orjson.dumps(
+                    {
+                        "filters": filters,
+                        "projection": projection,
+                        "offset": offset,
+                        "limit": limit,
+                    },
+                    option=orjson.OPT_SORT_KEYS,
+                )
+                accept_encoding = request.headers.get("accept-encoding", "")
+                response.headers["Vary"] = "Accept-Encoding"
+                cached = page_cache.get(page_key, accept_encoding)
+                if cached:
+                    return page_response(*cached, response.headers)
+                generation = page_cache.generation()
+                # filled from the primary, as the item cache is
+                collection = database.collection(resource.name)
+
+            query = dict(filters)
+            if cursor is None:
+                items = collection.find(query, projection).skip(offset)
+            else:
+                # keyset paging: seek past the last _id instead of skipping
+                after = decode_cursor(cursor)
+                if after:
+                    query["_id"] = {"$gt": after}
+                items = collection.find(query, projection).sort("_id", ASCENDING)
+
+            if media_type:
+                return StreamingResponse(
+                    stream_documents(
+                        items.limit(limit),
+                        selected.encode,
+                        media_type,
+                        stream_batch_size,
+                    ),
+                    media_type=media_type,
+                    headers=response.headers,
+                )
+
+            if cursor is None:
+                records = await items.limit(limit).to_list(limit)
+                content = await selected.encode_many(records)
+                if page_key:
+                    cached = page_cache.set(
+                        page_key, content, accept_encoding, generation
+                    )
+                    return page_response(*cached, response.headers)
+                return Response(
+                    content=content,
+                    media_type="application/json",
+                    headers=response.headers,
+                )
+
+            records = await items.limit(limit + 1).to_list(limit + 1)
+            if len(records) > limit:
+                records = records[:limit]
+                next_cursor = encode_cursor(records[-1]["_id"])
+                next_url = request.url.include_query_params(cursor=next_cursor)
+                response.headers["Next-Cursor"] = next_cursor
+                response.headers["Link"] = f'<{next_url}>; rel="next"'
+            return Response(
+                content=await selected.encode_many(records),
+                media_type="application/json",
+                headers=response.headers,
+            )
+
+        @router.put(
+            f"{path}/{{id}}",
+            name=f"update_{singular}",
+            status_code=status.HTTP_204_NO_CONTENT,
+            responses={**responses},
+            tags=tags,
+            dependencies=[Depends(no_snapshot)],
+            openapi_extra=self.update_validator.openapi(),
+        )
+        async def put(
+            id: str,
+            request: Request,
+            if_match: str | None = Header(default=None),
+        ) -> Response:
+            """
+            Replaces a resource, writing only the fields that changed
+            The natural key cannot be changed
+            """
+            oid = resource.object_id(id)
+            document = resource.document(await resource.update_validator.body(request))
+            await compact([document], serializer.table)
+
+            async def build(stored: dict) -> dict:
+                return document
+
+            return await resource.update(oid, build, if_match)
+
+        @router.patch(
+            f"{path}/{{id}}",
+            name=f"patch_{singular}",
+            status_code=status.HTTP_204_NO_CONTENT,
+            responses={**responses},
+            tags=tags,
+            dependencies=[Depends(no_snapshot)],
+        )
+        async def patch(
+            id: str,
+            request: Request,
+            if_match: str | None = Header(default=None),
+        ) -> Response:
+            """
+            Applies a JSON merge patch (application/merge-patch+json) to a
+            resource; null removes a property
+            The patched resource is validated as a whole and only the fields
+            that changed are written
+            """
+            oid = resource.object_id(id)
+            try:
+                changes = orjson.loads(await request.body())
+            except orjson.JSONDecodeError:
+                raise HTTPException(status_code=400, detail="Invalid JSON body.")
+            if not isinstance(changes, dict):
+                raise HTTPException(status_code=400, detail="Expected a JSON object.")
+
+            async def build(stored: dict) -> dict:
+                # rerun on the new content when another write lands first
+                current = await registry.expanding(serializer.to_edfi, stored)
+                for name in ("id", "_etag", "_lastModifiedDate"):
+                    current.pop(name, None)
+                try:
+                    fields = resource.update_validator.parse(
+                        merge_patch(current, changes)
+                    )
+                except ValidationError as e:
+                    raise HTTPException(status_code=422, detail=e.errors())
+                document = resource.document(fields)
+                await compact([document], serializer.table)
+                return document
+
+            return await resource.update(oid, build, if_match)
+
+        @router.delete(
+            f"{path}/{{id}}",
+            name=f"delete_{singular}",
+            status_code=status.HTTP_204_NO_CONTENT,
+            responses={**responses},
+            tags=tags,
+            dependencies=[Depends(no_snapshot)],
+        )
+        async def delete(
+            id: str,
+            if_match: str | None = Header(default=None),
+        ) -> Response:
+            """
+            Deletes a resource and records a tombstone for the change query
+            deletes feed
+            """
+            oid = resource.object_id(id)
+            query = {"_id": oid}
+            if if_match:
+                query.update(if_match_filter(if_match))
+            deleted = await database.collection(resource.name).find_one_and_delete(
+                query, {resource.key: 1}
+            )
+            if not deleted:
+                if if_match and await database.collection(resource.name).find_one(
+                    {"_id": oid}
+                ):
+                    raise HTTPException(
+                        status_code=status.HTTP_412_PRECONDITION_FAILED,
+                        detail="The resource has been modified by another consumer.",
+                    )
+                raise HTTPException(status_code=404, detail=resource.not_found)
+            resource.clear_list_caches()
+            resource.item_cache.delete(str(deleted["_id"]))
+            async with change_versions(database.get_database()) as version:
+                await database.collection(f"{resource.name}_deletes").replace_one(
+                    {"_id": deleted["_id"]},
+                    {
+                        "change_version": version,
+                        "key_values": {resource.key_alias: deleted[resource.key]},
+                        "deleted_date": datetime.utcnow(),
+                    },
+                    upsert=True,
+                )
+            return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+        return router
@@ -0,0 +1,72 @@
+import admission
+import resources
+import slow_queries
+import snapshots
+from fastapi import APIRouter, HTTPException, Query, Response, status
+
+router = APIRouter(prefix="/admin", include_in_schema=False)
+
+
+@router.get("/cache")
+async def cache_stats() -> dict:
+    """
+    Hit, miss and eviction counters of the in-process caches
+    """
+    return {resource.name: resource.cache_stats() for resource in resources.resources}
+
+
+@router.get("/admission")
+async def admission_stats() -> dict:
+    """
+    Limits, admitted and queued requests per route class
+    """
+    return admission.stats()
+
+
+@router.get("/slow-queries")
+async def list_slow_queries(
+    collscan: bool = Query(
+        default=False, description="Only queries explained as collection scans."
+    ),
+) -> list:
+    """
+    Recent MongoDB commands over SLOW_QUERY_MS, newest first, with their
+    redacted query shape, route and, when explained, plan
+    """
+    return slow_queries.recent(collscan)
+
+
+@router.delete("/slow-queries", status_code=status.HTTP_204_NO_CONTENT)
+async def clear_slow_queries() -> Response:
+    slow_queries.entries.clear()
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+def snapshot_summary(snapshot: dict) -> dict:
+    return {
+        "snapshotIdentifier": snapshot["_id"],
+        "createdDate": snapshot["created"],
+        "changeVersion": snapshot["change_version"],
+    }
+
+
+@router.post("/snapshots", status_code=status.HTTP_201_CREATED)
+async def create_snapshot() -> dict:
+    """
+    Copies the current data for reads with the Snapshot-Identifier header
+    Expired snapshots are dropped first
+    """
+    await snapshots.drop_expired_snapshots()
+    return snapshot_summary(await snapshots.create_snapshot())
+
+
+@router.get("/snapshots")
+async def list_snapshots() -> list:
+    return [snapshot_summary(s) for s in await snapshots.list_snapshots()]
+
+
+@router.delete("/snapshots/{identifier}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_snapshot(identifier: str) -> Response:
+    if not await snapshots.drop_snapshot(identifier):
+        raise HTTPException(status_code=404, detail="Snapshot not found.")
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,16 @@
+import database
+from change_queries import newest_change_version
+from fastapi import APIRouter
+
+router = APIRouter()
+
+
+@router.get("/changeQueries/v1/availableChangeVersions", tags=["changeQueries"])
+async def available_change_versions() -> dict:
+    """
+    Returns the range of change versions a synchronization can request
+    """
+    return {
+        "oldestChangeVersion": 0,
+        "newestChangeVersion": await newest_change_version(database.get_database()),
+    }
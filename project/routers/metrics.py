@@ -0,0 +1,15 @@
+import metrics
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+router = APIRouter(include_in_schema=False)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics() -> PlainTextResponse:
+    """
+    Request, MongoDB command and connection pool metrics in Prometheus format
+    """
+    return PlainTextResponse(
+        metrics.exposition(), media_type="text/plain; version=0.0.4"
+    )
@@ -9,6 +9,17 @@ from bson import ObjectId
 from bson.errors import InvalidId
 
 
+def bson_dates(value):
+    """BSON has no date-only type, so dates are stored as ISO strings"""
+    if isinstance(value, dict):
+        return {k: bson_dates(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [bson_dates(v) for v in value]
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
 class PyObjectId(ObjectId):
     @classmethod
     def __get_validators__(cls):
@@ -25,7 +36,13 @@ class PyObjectId(ObjectId):
         field_schema.update(type="string")
 
 
-class EducationOrganizationPeriod(BaseModel):
+class EdFiBaseModel(BaseModel):
+    class Config(BaseConfig):
+        # documents are stored by field name, requests arrive by alias
+        allow_population_by_field_name = True
+
+
+class EducationOrganizationPeriod(EdFiBaseModel):
     begin_date: date = Field(
         title="beginDate",
         alias="beginDate",
@@ -40,7 +57,7 @@ class EducationOrganizationPeriod(BaseModel):
     )
 
 
-class EducationOrganizationAddress(BaseModel):
+class EducationOrganizationAddress(EdFiBaseModel):
     address_type_descriptor: str = Field(
         title="addressTypeDescriptor",
         alias="addressTypeDescriptor",
@@ -149,7 +166,7 @@ class InternationalAddress(BaseModel):
     longitude: str = None
 
 
-class SchoolYearTypeReference(BaseModel):
+class SchoolYearTypeReference(EdFiBaseModel):
     school_year: int = Field(
         title="schoolYear",
         alias="schoolYear",
@@ -158,7 +175,7 @@ class SchoolYearTypeReference(BaseModel):
     )
 
 
-class EducationOrganizationCategory(BaseModel):
+class EducationOrganizationCategory(EdFiBaseModel):
     education_organization_category_descriptor: str = Field(
         title="educationOrganizationCategoryDescriptor",
         alias="educationOrganizationCategoryDescriptor",
@@ -168,7 +185,7 @@ class EducationOrganizationCategory(BaseModel):
     )
 
 
-class EducationOrganizationIdentificationCode(BaseModel):
+class EducationOrganizationIdentificationCode(EdFiBaseModel):
     education_organization_identification_system_descriptor: str = Field(
         title="educationOrganizationIdentificationSystemDescriptor",
         alias="educationOrganizationIdentificationSystemDescriptor",
@@ -183,7 +200,7 @@ class EducationOrganizationIdentificationCode(BaseModel):
     )
 
 
-class EducationOrganizationIndicator(BaseModel):
+class EducationOrganizationIndicator(EdFiBaseModel):
     indicator_descriptor: str = Field(
         title="indicatorDescriptor",
         alias="indicatorDescriptor",
@@ -221,7 +238,7 @@ class InstitutionTelephone(BaseModel):
     telephoneNumber: str
 
 
-class LocalEducationAgencyReference(BaseModel):
+class LocalEducationAgencyReference(EdFiBaseModel):
     local_education_agency_id: int = Field(
         title="localEducationAgencyId",
         alias="localEducationAgencyId",
@@ -234,7 +251,7 @@ class PostSecondaryInstitutionReference(BaseModel):
     postSecondaryInstitutionId: int
 
 
-class SchoolGradeLevel(BaseModel):
+class SchoolGradeLevel(EdFiBaseModel):
     grade_level_descriptor: str = Field(
         title="gradeLevelDescriptor",
         alias="gradeLevelDescriptor",
@@ -244,7 +261,7 @@ class SchoolGradeLevel(BaseModel):
     )
 
 
-class SchoolCategory(BaseModel):
+class SchoolCategory(EdFiBaseModel):
     school_category_descriptor: str = Field(
         title="schoolCategoryDescriptor",
         alias="schoolCategoryDescriptor",
@@ -284,6 +301,11 @@ class SchoolBaseModel(BaseModel):
         alias="charterApprovalSchoolYearTypeReference",
         description="",
     )
+    charter_approval_agency_type_descriptor: str | None = Field(
+        title="charterApprovalAgencyTypeDescriptor",
+        alias="charterApprovalAgencyTypeDescriptor",
+        description="The type of agency that approved the establishment or continuation of a charter school.",
+    )
     charter_status_descriptor: str | None = Field(
         title="charterStatusDescriptor",
         alias="charterStatusDescriptor",
@@ -388,7 +410,7 @@ class SchoolBaseModel(BaseModel):
             parsed.pop("_id")
         if "id" in parsed:
             parsed.pop("id")
-        return parsed
+        return bson_dates(parsed)
 
 
 class CreateSchoolModel(SchoolBaseModel):
@@ -410,6 +432,7 @@ class SchoolModel(SchoolBaseModel):
     last_modified_date: datetime = Field(
         default_factory=datetime.utcnow, alias="_lastModifiedDate"
     )
+    content_hash: str | None = Field(default=None, alias="_etag")
 
     class Config:
         allow_population_by_field_name = True
@@ -0,0 +1,144 @@
+import hashlib
+from functools import lru_cache
+from typing import Any, Iterable, List, Tuple, Type
+
+import orjson
+from bson.objectid import ObjectId
+from descriptors import is_descriptor, registry
+from pydantic import BaseModel
+
+# (stored key, Ed-Fi alias, nested table or None, stored as a descriptor id)
+FieldTable = List[Tuple[str, str, Any, bool]]
+
+
+def field_table(model: Type[BaseModel]) -> FieldTable:
+    """
+    Walks a model once and records, for every field, the key it is stored
+    under, the alias it is served as, the table of any nested model and
+    whether it holds a descriptor
+    """
+    table = []
+    for name, field in model.__fields__.items():
+        nested = None
+        if isinstance(field.type_, type) and issubclass(field.type_, BaseModel):
+            nested = field_table(field.type_)
+        # from_mongo reads the document _id into the id field
+        stored = "_id" if name == "id" else name
+        table.append((stored, field.alias, nested, is_descriptor(name)))
+    return table
+
+
+def to_edfi(document: dict, table: FieldTable) -> dict:
+    """
+    Renames a stored document to its Ed-Fi aliases without validating it
+    Descriptor ids are expanded back to their URIs
+    """
+    out = {}
+    for stored, alias, nested, descriptor in table:
+        value = document.get(stored)
+        if descriptor and value is not None:
+            value = registry.expand(value)
+        elif nested is not None and value is not None:
+            if isinstance(value, list):
+                value = [to_edfi(item, nested) for item in value]
+            else:
+                value = to_edfi(value, nested)
+        out[alias] = value
+    return out
+
+
+def prune_table(
+    table: FieldTable, requested: dict, prefix: str = ""
+) -> Tuple[FieldTable, dict]:
+    """
+    Keeps the entries of table named in requested, an alias tree where None
+    selects a whole field, and builds the mongo projection for them
+    Raises ValueError for names the model lacks
+    """
+    aliases = {entry[1] for entry in table}
+    unknown = [prefix + alias for alias in requested if alias not in aliases]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+    pruned = []
+    projection = {}
+    for stored, alias, nested, descriptor in table:
+        if alias not in requested:
+            continue
+        subtree = requested[alias]
+        if subtree is None:
+            projection[stored] = 1
+        elif nested is None:
+            raise ValueError(f"Field {prefix + alias} has no sub-fields")
+        else:
+            nested, sub_projection = prune_table(nested, subtree, f"{prefix}{alias}.")
+            for path in sub_projection:
+                projection[f"{stored}.{path}"] = 1
+        pruned.append((stored, alias, nested, descriptor))
+    return pruned, projection
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError
+
+
+def content_hash(document: dict) -> str:
+    """
+    Stable digest of a stored document's content
+    Callers leave out _id and last_modified_date so re-posts hash the same
+    """
+    canonical = orjson.dumps(document, option=orjson.OPT_SORT_KEYS, default=_default)
+    return hashlib.blake2b(canonical, digest_size=16).hexdigest()
+
+
+class DocumentSerializer:
+    """
+    Read-path serializer for documents this API stored itself
+    Skips pydantic validation and jsonable_encoder, emitting JSON bytes
+    """
+
+    def __init__(self, model: Type[BaseModel], table: FieldTable = None) -> None:
+        self.model = model
+        self.table = table if table is not None else field_table(model)
+        self.project = lru_cache(maxsize=256)(self._project)
+
+    def _project(self, fields: str) -> Tuple[dict, "DocumentSerializer"]:
+        """
+        Translates comma-separated Ed-Fi names, dotted for nested fields, into
+        a mongo projection and a serializer for the partial documents
+        The id is always returned
+        """
+        requested = {"id": None}
+        for field in fields.split(","):
+            path = [name.strip() for name in field.split(".")]
+            if not all(path):
+                raise ValueError(f"Invalid field: {field.strip()!r}")
+            node = requested
+            for name in path[:-1]:
+                if node.get(name, {}) is None:
+                    break
+                node = node.setdefault(name, {})
+            else:
+                node[path[-1]] = None
+        table, projection = prune_table(self.table, requested)
+        return projection, DocumentSerializer(self.model, table)
+
+    def to_edfi(self, document: dict) -> dict:
+        return to_edfi(document, self.table)
+
+    def dumps(self, document: dict) -> bytes:
+        return orjson.dumps(to_edfi(document, self.table), default=_default)
+
+    def dumps_many(self, documents: Iterable[dict]) -> bytes:
+        return orjson.dumps(
+            [to_edfi(document, self.table) for document in documents],
+            default=_default,
+        )
+
+    async def encode(self, document: dict) -> bytes:
+        """dumps, first reading descriptors other workers added"""
+        return await registry.expanding(self.dumps, document)
+
+    async def encode_many(self, documents: List[dict]) -> bytes:
+        return await registry.expanding(self.dumps_many, documents)
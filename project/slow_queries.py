@@ -0,0 +1,219 @@
+import asyncio
+import collections
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+import access_log
+import database
+import metrics
+import orjson
+from logger import logger, request_id
+from pymongo import monitoring
+from pymongo.errors import PyMongoError
+
+# commands slower than this are recorded; a negative value records none
+threshold = float(os.environ.get("SLOW_QUERY_MS", 100)) / 1000
+# re-runs slow reads with explain("executionStats") in the background
+explain_enabled = os.environ.get("SLOW_QUERY_EXPLAIN", "false").lower() == "true"
+# seconds before the same query shape is explained again
+explain_interval = float(os.environ.get("SLOW_QUERY_EXPLAIN_INTERVAL", 300))
+
+# most recent slow commands, oldest first
+entries: collections.deque = collections.deque(
+    maxlen=int(os.environ.get("SLOW_QUERY_BUFFER", 200))
+)
+
+# command fields that carry the query, as opposed to documents or options
+QUERY_FIELDS = ("filter", "query", "pipeline", "sort", "projection", "key")
+EXPLAINABLE = ("find", "aggregate", "count", "distinct")
+# session and routing fields a command cannot be explained with
+SESSION_FIELDS = ("lsid", "txnNumber", "autocommit", "startTransaction")
+
+
+def redact(value: Any) -> Any:
+    """
+    Shape of a query: field names and operators stay, values become "?"
+    Arrays keep one entry per distinct shape
+    """
+    if isinstance(value, dict):
+        return {name: redact(item) for name, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        shapes = []
+        for item in value:
+            shape = redact(item)
+            if shape not in shapes:
+                shapes.append(shape)
+        return shapes
+    return "?"
+
+
+def query_shape(command_name: str, command: dict) -> dict:
+    shape = {
+        name: command[name] if name == "sort" else redact(command[name])
+        for name in QUERY_FIELDS
+        if name in command
+    }
+    # update and delete commands carry one query per statement
+    for statements in ("updates", "deletes"):
+        if statements in command:
+            shape["q"] = redact(
+                [statement.get("q") for statement in command[statements]]
+            )
+    if command_name == "findAndModify" and "update" in command:
+        shape["update"] = redact(command["update"])
+    return shape
+
+
+def plan_summary(explained: dict) -> dict:
+    """Plan stages and execution counts of an explain result, on any server version"""
+    stages = []
+    stats = {}
+
+    def walk(value: Any) -> None:
+        if isinstance(value, dict):
+            if isinstance(value.get("stage"), str):
+                stages.append(value["stage"])
+            if "executionStats" in value and not stats:
+                stats.update(value["executionStats"])
+            for name, item in value.items():
+                if name != "rejectedPlans":
+                    walk(item)
+        elif isinstance(value, list):
+            for item in value:
+                walk(item)
+
+    walk(explained)
+    return {
+        "stages": list(dict.fromkeys(stages)),
+        "collscan": "COLLSCAN" in stages,
+        "returned": stats.get("nReturned"),
+        "keysExamined": stats.get("totalKeysExamined"),
+        "docsExamined": stats.get("totalDocsExamined"),
+        "executionMs": stats.get("executionTimeMillis"),
+    }
+
+
+class SlowCommands(monitoring.CommandListener):
+    """
+    Records commands over the threshold with their redacted query shape and
+    the route that issued them; slow reads may be explained in the
+    background, flagging collection scans
+    Callbacks run on Motor's executor threads in a copy of the request's
+    context, so explains are handed to the event loop
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.loop = loop
+        self._started: Dict[Tuple, dict] = {}
+        # (collection, shape) -> [explained at, plan summary, entries awaiting it]
+        self._plans: Dict[Tuple[str, bytes], list] = {}
+        self._lock = threading.Lock()
+        # held so running explains are not collected
+        self._explains: set = set()
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        if event.command_name != "explain":
+            self._started[(event.connection_id, event.request_id)] = event.command
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._record(event, "success")
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._record(event, "failure")
+
+    def _record(self, event, outcome: str) -> None:
+        command = self._started.pop((event.connection_id, event.request_id), None)
+        seconds = event.duration_micros / 1_000_000
+        if command is None or seconds < threshold:
+            return
+        collection = command.get(event.command_name)
+        collection = collection if isinstance(collection, str) else ""
+        shape = query_shape(event.command_name, command)
+        scope = access_log.request_scope.get()
+        entry = {
+            "recorded": datetime.utcnow().isoformat(timespec="milliseconds") + "Z",
+            "command": event.command_name,
+            "collection": collection,
+            "durationMs": round(seconds * 1000, 3),
+            "outcome": outcome,
+            "route": metrics.route_template(scope) if scope else None,
+            "method": scope["method"] if scope else None,
+            "requestId": request_id.get(),
+            "shape": shape,
+            "plan": None,
+        }
+        entries.append(entry)
+        metrics.mongo_slow_commands.inc(event.command_name, collection)
+        logger.warning("Slow MongoDB command", extra={"fields": entry})
+
+        if not explain_enabled or event.command_name not in EXPLAINABLE:
+            return
+        if any(
+            "$out" in stage or "$merge" in stage
+            for stage in command.get("pipeline", [])
+        ):
+            return
+        key = (collection, orjson.dumps(shape, default=str))
+        now = time.monotonic()
+        with self._lock:
+            explained = self._plans.get(key)
+            if explained and now - explained[0] < explain_interval:
+                # the same query was explained recently, or is being explained
+                if explained[1] is None:
+                    explained[2].append(entry)
+                entry["plan"] = explained[1]
+                return
+            self._plans[key] = [now, None, [entry]]
+        self.loop.call_soon_threadsafe(
+            self._start_explain, event.database_name, command, key, entry
+        )
+
+    def _start_explain(self, *args) -> None:
+        task = self.loop.create_task(self._explain(*args))
+        self._explains.add(task)
+        task.add_done_callback(self._explains.discard)
+
+    async def _explain(
+        self, database_name: str, command: dict, key: Tuple, entry: dict
+    ) -> None:
+        explainable = {
+            name: value
+            for name, value in command.items()
+            if not name.startswith("$") and name not in SESSION_FIELDS
+        }
+        try:
+            explained = await database.client[database_name].command(
+                {"explain": explainable, "verbosity": "executionStats"}
+            )
+        except PyMongoError as e:
+            logger.error(f"Unable to explain a slow {entry['command']}: {e}")
+            with self._lock:
+                self._plans.pop(key, None)
+            return
+        plan = plan_summary(explained)
+        with self._lock:
+            self._plans[key][1] = plan
+            for waiting in self._plans[key][2]:
+                waiting["plan"] = plan
+            self._plans[key][2] = []
+        if plan["collscan"]:
+            metrics.mongo_collection_scans.inc(entry["collection"])
+            logger.warning("Collection scan", extra={"fields": entry})
+
+
+def listeners() -> List[monitoring.CommandListener]:
+    """Listeners for the client; none when SLOW_QUERY_MS is negative"""
+    if threshold < 0:
+        return []
+    return [SlowCommands(asyncio.get_running_loop())]
+
+
+def recent(collscan: bool = False) -> List[dict]:
+    """Newest first; collscan keeps only entries explained as collection scans"""
+    found = reversed(list(entries))
+    if collscan:
+        return [entry for entry in found if entry["plan"] and entry["plan"]["collscan"]]
+    return list(found)
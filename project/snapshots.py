@@ -0,0 +1,116 @@
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+import database
+from bson.objectid import ObjectId
+from change_queries import newest_change_version
+from fastapi import Header, HTTPException, status
+from logger import logger
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import IndexModel
+
+# seconds a snapshot stays readable
+snapshot_ttl = int(os.environ.get("SNAPSHOT_TTL", 24 * 60 * 60))
+
+# collection -> indexes rebuilt on its snapshot copies
+snapshot_collections: Dict[str, List[IndexModel]] = {}
+
+
+def register(name: str, indexes: List[IndexModel]) -> None:
+    """Includes a collection, and the indexes its reads need, in snapshots"""
+    snapshot_collections[name] = indexes
+
+
+def copy_name(identifier: str, name: str) -> str:
+    return f"snapshot_{identifier}_{name}"
+
+
+async def create_snapshot() -> dict:
+    """
+    Materializes a read-only copy of every registered collection
+    Each copy is built with one $out pass, and reads under the snapshot
+    see only the copy, so pages cannot shift as writes arrive
+    """
+    identifier = str(ObjectId())
+    snapshot = {
+        "_id": identifier,
+        "created": datetime.utcnow(),
+        "change_version": await newest_change_version(database.get_database()),
+        "collections": {},
+    }
+    for name, indexes in snapshot_collections.items():
+        copy = copy_name(identifier, name)
+        await database.collection(name).aggregate([{"$out": copy}]).to_list(None)
+        if indexes:
+            await database.collection(copy).create_indexes(indexes)
+        snapshot["collections"][name] = copy
+    await database.collection("snapshots").insert_one(snapshot)
+    logger.info(f"Created snapshot {identifier}")
+    return snapshot
+
+
+async def drop_snapshot(identifier: str) -> bool:
+    snapshot = await database.collection("snapshots").find_one_and_delete(
+        {"_id": identifier}
+    )
+    if not snapshot:
+        return False
+    for copy in snapshot["collections"].values():
+        await database.collection(copy).drop()
+    logger.info(f"Dropped snapshot {identifier}")
+    return True
+
+
+async def drop_expired_snapshots() -> None:
+    expired = datetime.utcnow() - timedelta(seconds=snapshot_ttl)
+    async for snapshot in database.collection("snapshots").find(
+        {"created": {"$lt": expired}}, {"_id": 1}
+    ):
+        await drop_snapshot(snapshot["_id"])
+
+
+async def list_snapshots() -> List[dict]:
+    return await database.collection("snapshots").find().to_list(None)
+
+
+def expired(snapshot: dict) -> bool:
+    return snapshot["created"] < datetime.utcnow() - timedelta(seconds=snapshot_ttl)
+
+
+async def snapshot_collection(identifier: str, name: str) -> AsyncIOMotorCollection:
+    """
+    Copy of collection name in a snapshot
+    Raises 410 for snapshots that do not exist or have expired
+    The snapshot is read on every request, not cached, since any worker
+    may have dropped it
+    """
+    snapshot = await database.collection("snapshots").find_one({"_id": identifier})
+    if snapshot is None or expired(snapshot) or name not in snapshot["collections"]:
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="The snapshot does not exist or is no longer available.",
+        )
+    # from the primary: a secondary may not have the $out copy yet
+    return database.collection(snapshot["collections"][name])
+
+
+def snapshot_identifier(
+    snapshot_identifier: str
+    | None = Header(
+        default=None,
+        description="Indicates the resource snapshot on which to operate. If not present, the current data is used.",
+    ),
+) -> str | None:
+    return snapshot_identifier
+
+
+def no_snapshot(
+    snapshot_identifier: str | None = Header(default=None),
+) -> None:
+    """Snapshots are read-only"""
+    if snapshot_identifier:
+        raise HTTPException(
+            status_code=status.HTTP_405_METHOD_NOT_ALLOWED,
+            detail="The method is not allowed when the Snapshot-Identifier header is present.",
+        )
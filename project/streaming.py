@@ -0,0 +1,57 @@
+from typing import AsyncIterator, Awaitable, Callable
+
+from fastapi import Request
+from motor.motor_asyncio import AsyncIOMotorCursor
+
+NDJSON = "application/x-ndjson"
+JSON = "application/json"
+
+
+def streaming_media_type(stream: str | None, request: Request) -> str | None:
+    """
+    Picks the streamed representation requested by the client
+    The stream query flag wins over the Accept header
+    """
+    if stream == "ndjson":
+        return NDJSON
+    if stream == "json":
+        return JSON
+    if NDJSON in request.headers.get("accept", ""):
+        return NDJSON
+    return None
+
+
+async def stream_documents(
+    cursor: AsyncIOMotorCursor,
+    serialize: Callable[[dict], Awaitable[bytes]],
+    media_type: str,
+    batch_size: int,
+) -> AsyncIterator[bytes]:
+    """
+    Writes documents as the cursor yields them, one chunk per batch
+    Emits NDJSON lines or the items of a single JSON array
+    """
+    ndjson = media_type == NDJSON
+    if not ndjson:
+        yield b"["
+    first = True
+    chunk = []
+    pending = 0
+    async for document in cursor.batch_size(batch_size):
+        if ndjson:
+            chunk.append(await serialize(document))
+            chunk.append(b"\n")
+        else:
+            if not first:
+                chunk.append(b",")
+            chunk.append(await serialize(document))
+            first = False
+        pending += 1
+        if pending == batch_size:
+            yield b"".join(chunk)
+            chunk = []
+            pending = 0
+    if chunk:
+        yield b"".join(chunk)
+    if not ndjson:
+        yield b"]"
@@ -0,0 +1,81 @@
+from bson.objectid import ObjectId
+from change_queries import VERSION_FIELDS
+
+
+def upsert_pipeline(document: dict, new_id: ObjectId) -> list:
+    """
+    Update pipeline that overwrites a stored document with document in one
+    round trip. Content with an unchanged content_hash keeps its
+    last_modified_date and change_version, so an identical re-post leaves
+    the stored document as it was and the server skips the write. A new
+    document gets new_id, which tells the caller it was inserted.
+    """
+    unchanged = {"$eq": ["$content_hash", document["content_hash"]]}
+    fields = {
+        # $literal stops strings that start with $ being read as field paths
+        name: {"$literal": value}
+        for name, value in document.items()
+        if name not in VERSION_FIELDS
+    }
+    for name in VERSION_FIELDS:
+        if name in document:
+            fields[name] = {"$cond": [unchanged, f"${name}", document[name]]}
+    return [{"$set": {"_id": {"$ifNull": ["$_id", new_id]}, **fields}}]
+
+
+# stored fields a diff leaves to the caller
+UNDIFFED_FIELDS = ("_id", *VERSION_FIELDS)
+
+
+def update_diff(stored: dict, document: dict) -> dict:
+    """
+    Smallest update turning stored into document: $set for changed fields,
+    addressed by dotted path inside subdocuments, $unset for removed ones
+    and $push for arrays that only grew at the end. Other changed arrays
+    are set whole. Returns an empty dict when nothing changed.
+    """
+    update = {"$set": {}, "$unset": {}, "$push": {}}
+    _diff(stored, document, "", update)
+    return {operator: fields for operator, fields in update.items() if fields}
+
+
+def _diff(stored: dict, document: dict, prefix: str, update: dict) -> None:
+    for name, value in document.items():
+        if not prefix and name in UNDIFFED_FIELDS:
+            continue
+        path = prefix + name
+        if name not in stored:
+            update["$set"][path] = value
+            continue
+        old = stored[name]
+        if isinstance(old, dict) and isinstance(value, dict):
+            _diff(old, value, f"{path}.", update)
+        elif (
+            isinstance(old, list)
+            and isinstance(value, list)
+            and 0 < len(old) < len(value)
+            and value[: len(old)] == old
+        ):
+            update["$push"][path] = {"$each": value[len(old) :]}
+        elif old != value or type(old) is not type(value):
+            # 1 == 1.0 == True, but each is stored differently
+            update["$set"][path] = value
+    for name in stored:
+        if name not in document and not (not prefix and name in UNDIFFED_FIELDS):
+            update["$unset"][prefix + name] = ""
+
+
+def merge_patch(target, patch):
+    """
+    Applies a JSON merge patch (RFC 7396): objects merge recursively, null
+    removes a member and anything else replaces the target value
+    """
+    if not isinstance(patch, dict):
+        return patch
+    merged = dict(target) if isinstance(target, dict) else {}
+    for name, value in patch.items():
+        if value is None:
+            merged.pop(name, None)
+        else:
+            merged[name] = merge_patch(merged.get(name), value)
+    return merged
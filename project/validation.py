@@ -0,0 +1,277 @@
+import email.message
+import functools
+import json
+import os
+from datetime import date
+from typing import Any, Callable, Dict, List, Tuple, Type
+
+import orjson
+from fastapi import Request
+from fastapi.exceptions import RequestValidationError
+from logger import logger
+from pydantic import BaseConfig, BaseModel, Extra, ValidationError
+from pydantic.error_wrappers import ErrorWrapper
+from pydantic.errors import MissingError
+from pydantic.fields import SHAPE_LIST, SHAPE_SINGLETON, ModelField, Required
+
+BODY = ("body",)
+
+
+class Unsupported(Exception):
+    """The model uses something the compiler does not handle"""
+
+
+class Invalid(Exception):
+    """The value needs pydantic: it is wrong, or pydantic would convert it"""
+
+
+@functools.lru_cache(maxsize=64)
+def is_json(content_type: str) -> bool:
+    """Content types FastAPI reads a Body parameter as JSON from"""
+    message = email.message.Message()
+    message["content-type"] = content_type
+    if message.get_content_maintype() != "application":
+        return False
+    subtype = message.get_content_subtype()
+    return subtype == "json" or subtype.endswith("+json")
+
+
+def loads(body: bytes) -> Any:
+    try:
+        return orjson.loads(body)
+    except orjson.JSONDecodeError:
+        # what orjson rejects json may accept, and json's errors are FastAPI's
+        try:
+            return json.loads(body)
+        except json.JSONDecodeError as e:
+            raise RequestValidationError([ErrorWrapper(e, ("body", e.pos))], body=e.doc)
+
+
+class ModelValidator:
+    """
+    Builds stored documents (model.mongo() output) from payloads with the
+    pydantic model
+    """
+
+    def __init__(self, model: Type[BaseModel]) -> None:
+        self.model = model
+        # what FastAPI validates a Body parameter with
+        self.body_field = ModelField.infer(
+            name="body",
+            value=Required,
+            annotation=model,
+            class_validators=None,
+            config=BaseConfig,
+        )
+
+    def parse(self, data: Any, loc: Tuple[str, ...] | None = None) -> dict:
+        """
+        Raises ValidationError; errors are located like parse_obj's, or
+        under loc like FastAPI's for a request body
+        """
+        if loc is None:
+            return self.model.parse_obj(data).mongo()
+        value, errors = self.body_field.validate(data, {}, loc=loc)
+        if errors:
+            raise ValidationError(
+                errors if isinstance(errors, list) else [errors], self.model
+            )
+        return value.mongo()
+
+    async def body(self, request: Request) -> dict:
+        """
+        Reads and validates a JSON request body as FastAPI does a Body
+        parameter, with the same 422 responses
+        """
+        data = None
+        body = await request.body()
+        if body:
+            content_type = request.headers.get("content-type")
+            data = loads(body) if not content_type or is_json(content_type) else body
+        if data is None:
+            raise RequestValidationError([ErrorWrapper(MissingError(), loc=BODY)])
+        try:
+            return self.parse(data, BODY)
+        except ValidationError as e:
+            raise RequestValidationError(e.raw_errors, body=data)
+
+    def openapi(self) -> dict:
+        """Request body documentation for routes that read it with body()"""
+        schema = self.model.schema(ref_template="#/components/schemas/{model}")
+        # nested models are documented through the response models
+        schema.pop("definitions", None)
+        return {
+            "requestBody": {
+                "content": {"application/json": {"schema": schema}},
+                "required": True,
+            }
+        }
+
+
+def iso_date(value: str) -> bool:
+    try:
+        return date.fromisoformat(value).isoformat() == value
+    except ValueError:
+        return False
+
+
+# type -> (check of a value already in the form pydantic returns it, or None)
+SCALARS = {
+    int: "type({v}) is int",
+    float: "type({v}) is float",
+    str: "type({v}) is str",
+    bool: "type({v}) is bool",
+    # stored as the ISO string mongo() turns dates into
+    date: "type({v}) is str and iso_date({v})",
+}
+
+
+class ModelCompiler:
+    """
+    Generates one function per model, from the field metadata its JSON
+    schema is built from, that reads a payload in a single pass: it looks
+    fields up by alias (and by name where the model allows), checks their
+    types and returns the stored document. Values pydantic would reject or
+    convert raise Invalid.
+    """
+
+    def __init__(self) -> None:
+        self.names: Dict[Type[BaseModel], str] = {}
+        self.lines: List[str] = []
+        self.namespace = {"Invalid": Invalid, "MISSING": object(), "iso_date": iso_date}
+
+    def compile(self, model: Type[BaseModel]) -> Callable[[Any], dict]:
+        name = self.function(model)
+        exec("\n".join(self.lines), self.namespace)
+        return self.namespace[name]
+
+    def constant(self, value: Any) -> str:
+        if value is None:
+            return "None"
+        if not isinstance(value, (str, int, float, bool)):
+            raise Unsupported(f"default {value!r}")
+        name = f"constant_{len(self.namespace)}"
+        self.namespace[name] = value
+        return name
+
+    def function(self, model: Type[BaseModel]) -> str:
+        if model in self.names:
+            return self.names[model]
+        name = f"validate_{len(self.names)}_{model.__name__}"
+        self.names[model] = name
+        config = model.__config__
+        if (
+            model.__pre_root_validators__
+            or model.__post_root_validators__
+            or config.extra == Extra.allow
+            or config.anystr_strip_whitespace
+            or config.anystr_lower
+            or config.min_anystr_length
+            or config.max_anystr_length
+        ):
+            raise Unsupported(f"{model.__name__} validators or config")
+
+        lines = [
+            f"def {name}(data):",
+            "    if type(data) is not dict:",
+            "        raise Invalid",
+            "    out = {}",
+        ]
+        known = set()
+        for field in model.__fields__.values():
+            known.add(field.alias)
+            lookup = config.allow_population_by_field_name and field.alt_alias
+            if lookup:
+                known.add(field.name)
+            lines += self.field(field, lookup)
+        if config.extra == Extra.forbid:
+            lines += [
+                f"    if not data.keys() <= {known!r}:",
+                "        raise Invalid",
+            ]
+        lines.append("    return out")
+        self.lines += lines
+        return name
+
+    def check(self, field: ModelField, v: str) -> Tuple[str | None, str]:
+        """(condition, stored value) for a single value of field"""
+        type_ = field.type_
+        if isinstance(type_, type) and issubclass(type_, BaseModel):
+            return None, f"{self.function(type_)}({v})"
+        if type_ in SCALARS:
+            return SCALARS[type_].format(v=v), v
+        raise Unsupported(f"{field.name}: {type_!r}")
+
+    def field(self, field: ModelField, lookup: bool) -> List[str]:
+        if (
+            field.class_validators
+            or field.default_factory
+            or field.field_info.get_constraints()
+        ):
+            raise Unsupported(f"{field.name} validators or constraints")
+        if field.shape == SHAPE_SINGLETON:
+            condition, value = self.check(field, "value")
+        elif field.shape == SHAPE_LIST:
+            item = field.sub_fields[0]
+            if item.allow_none or item.shape != SHAPE_SINGLETON:
+                raise Unsupported(f"{field.name} items")
+            item_condition, item_value = self.check(item, "item")
+            condition = "type(value) is list"
+            if item_condition:
+                condition += f" and all({item_condition} for item in value)"
+            value = f"[{item_value} for item in value]"
+        else:
+            raise Unsupported(f"{field.name} shape")
+
+        target = f"out[{field.name!r}]"
+        lines = [f"    value = data.get({field.alias!r}, MISSING)"]
+        if lookup:
+            lines += [
+                "    if value is MISSING:",
+                f"        value = data.get({field.name!r}, MISSING)",
+            ]
+        lines.append("    if value is MISSING:")
+        if field.required:
+            lines.append("        raise Invalid")
+        else:
+            lines.append(f"        {target} = {self.constant(field.default)}")
+        lines.append("    elif value is None:")
+        lines.append(
+            f"        {target} = None" if field.allow_none else "        raise Invalid"
+        )
+        if condition:
+            lines += [f"    elif {condition}:", f"        {target} = {value}"]
+            lines += ["    else:", "        raise Invalid"]
+        else:
+            lines += ["    else:", f"        {target} = {value}"]
+        return lines
+
+
+class CompiledValidator(ModelValidator):
+    """
+    Takes the generated function's document when the payload is already in
+    its final form, and otherwise leaves the record to pydantic, so results
+    and errors are pydantic's either way
+    """
+
+    def __init__(self, model: Type[BaseModel]) -> None:
+        super().__init__(model)
+        self.fast = ModelCompiler().compile(model)
+
+    def parse(self, data: Any, loc: Tuple[str, ...] | None = None) -> dict:
+        try:
+            return self.fast(data)
+        except Invalid:
+            return super().parse(data, loc)
+
+
+def validator_from_env(model: Type[BaseModel]) -> ModelValidator:
+    """
+    INGEST_VALIDATOR is compiled (default) or pydantic
+    """
+    if os.environ.get("INGEST_VALIDATOR", "compiled").lower() == "compiled":
+        try:
+            return CompiledValidator(model)
+        except Unsupported as e:
+            logger.warning(f"{model.__name__} is validated with pydantic: {e}")
+    return ModelValidator(model)
@@ -0,0 +1,60 @@
+import asyncio
+import logging
+import os
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "project"))
+os.environ.setdefault("MONGODB_URL", "mongodb://localhost:27017")
+
+import database  # noqa: E402
+
+SCHOOL = {
+    "schoolId": 255901001,
+    "nameOfInstitution": "Grand Bend High School",
+    "schoolTypeDescriptor": "uri://ed-fi.org/SchoolTypeDescriptor#Regular",
+    "localEducationAgencyReference": {"localEducationAgencyId": 255901},
+    "educationOrganizationCategories": [
+        {
+            "educationOrganizationCategoryDescriptor": "uri://ed-fi.org/EducationOrganizationCategoryDescriptor#School"
+        }
+    ],
+    "gradeLevels": [
+        {"gradeLevelDescriptor": "uri://ed-fi.org/GradeLevelDescriptor#Ninth grade"}
+    ],
+    "addresses": [
+        {
+            "addressTypeDescriptor": "uri://ed-fi.org/AddressTypeDescriptor#Physical",
+            "city": "Grand Bend",
+            "postalCode": "78834",
+            "stateAbbreviationDescriptor": "uri://ed-fi.org/StateAbbreviationDescriptor#TX",
+            "streetNumberName": "1 Main St",
+        }
+    ],
+}
+
+
+@pytest.fixture
+def run_api(monkeypatch):
+    """
+    Runs a test coroutine against the app, started with a local stand-in
+    for MongoDB, passing it an httpx client
+    """
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    stand_in = AsyncMongoMockClient()
+    monkeypatch.setattr(database, "AsyncIOMotorClient", lambda url, **options: stand_in)
+    from main import api
+
+    async def run(test):
+        await api.router.startup()
+        try:
+            async with httpx.AsyncClient(app=api, base_url="http://test") as client:
+                return await test(client)
+        finally:
+            await api.router.shutdown()
+
+    return lambda test: asyncio.run(run(test))
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+from admission import Limiter
+
+
+def run(test):
+    return asyncio.run(test())
+
+
+def test_release_hands_the_slot_to_the_first_waiter():
+    async def test():
+        limiter = Limiter("read", 1, 2, 1)
+        assert await limiter.acquire() is None
+        first = asyncio.create_task(limiter.acquire())
+        second = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert len(limiter.waiters) == 2
+        limiter.release()
+        assert await first is None
+        assert not second.done()
+        assert limiter.active == 1
+        limiter.release()
+        assert await second is None
+        limiter.release()
+        return limiter
+
+    limiter = run(test)
+    assert limiter.active == 0 and not limiter.waiters
+
+
+def test_waiters_time_out_and_the_queue_is_bounded():
+    async def test():
+        limiter = Limiter("read", 1, 1, 0.01)
+        assert await limiter.acquire() is None
+        waiting = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert await limiter.acquire() == "queue_full"
+        assert await waiting == "timeout"
+        return limiter
+
+    limiter = run(test)
+    assert limiter.active == 1 and not limiter.waiters
+
+
+def test_a_slot_handed_over_at_the_deadline_is_kept(monkeypatch):
+    limiter = Limiter("read", 1, 1, 1)
+
+    async def wait_for(future, timeout):
+        # Python 3.12+ raises TimeoutError even when the future has its result
+        limiter.release()
+        raise asyncio.TimeoutError
+
+    async def test():
+        assert await limiter.acquire() is None
+        monkeypatch.setattr(asyncio, "wait_for", wait_for)
+        assert await limiter.acquire() is None
+        limiter.release()
+
+    run(test)
+    assert limiter.active == 0 and not limiter.waiters
+
+
+def test_a_slot_handed_to_a_cancelled_waiter_is_released(monkeypatch):
+    limiter = Limiter("read", 1, 1, 1)
+
+    async def wait_for(future, timeout):
+        # the client goes away just after release handed it the slot
+        limiter.release()
+        raise asyncio.CancelledError
+
+    async def test():
+        assert await limiter.acquire() is None
+        monkeypatch.setattr(asyncio, "wait_for", wait_for)
+        with pytest.raises(asyncio.CancelledError):
+            await limiter.acquire()
+
+    run(test)
+    assert limiter.active == 0 and not limiter.waiters
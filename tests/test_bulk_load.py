@@ -0,0 +1,19 @@
+import io
+import json
+
+import pytest
+from bulk_load import array_items
+
+ARRAY = [{"name": 'a "quoted" ], name', "id": 12345}, 1.5e3, [], "é", True, None]
+
+
+@pytest.mark.parametrize("block", [1, 2, 7, 1 << 16])
+def test_array_items_are_decoded_across_blocks(block):
+    data = json.dumps(ARRAY).encode()[1:]
+    assert list(array_items(io.BytesIO(data), block)) == ARRAY
+
+
+@pytest.mark.parametrize("data", [b"1, 2", b"1 2]", b"1,]", b",1]"])
+def test_malformed_arrays_are_rejected(data):
+    with pytest.raises(ValueError):
+        list(array_items(io.BytesIO(data), 2))
@@ -0,0 +1,49 @@
+import asyncio
+
+from bson.objectid import ObjectId
+from change_queries import change_versions, newest_change_version
+from mongomock_motor import AsyncMongoMockClient
+
+
+def run(test):
+    return asyncio.run(test(AsyncMongoMockClient().edfi))
+
+
+def test_newest_change_version_stays_below_writes_in_progress():
+    async def test(database):
+        async with change_versions(database) as first:
+            async with change_versions(database, 2) as second:
+                assert (first, second) == (1, 3)
+                assert await newest_change_version(database) == 0
+            # the later block is written, the earlier one is not yet
+            assert await newest_change_version(database) == 0
+        assert await newest_change_version(database) == 3
+
+    run(test)
+
+
+def test_a_failed_write_releases_its_change_versions():
+    async def test(database):
+        try:
+            async with change_versions(database):
+                raise ValueError
+        except ValueError:
+            pass
+        assert await newest_change_version(database) == 1
+
+    run(test)
+
+
+def test_abandoned_reservations_expire():
+    async def test(database):
+        abandoned = str(
+            ObjectId.from_datetime(ObjectId().generation_time.replace(year=2000))
+        )
+        await database.counters.insert_one(
+            {"_id": "change_version", "value": 5, "reserved": {abandoned: 5}}
+        )
+        assert await newest_change_version(database) == 5
+        counter = await database.counters.find_one({"_id": "change_version"})
+        assert counter["reserved"] == {}
+
+    run(test)
@@ -0,0 +1,84 @@
+import asyncio
+
+import database
+from coalescer import WriteCoalescer
+from conftest import SCHOOL
+
+
+def coalescer(flush):
+    return WriteCoalescer("test", flush, 0.01, 100, key=lambda item: item[0])
+
+
+def test_each_caller_gets_its_own_result():
+    batches = []
+
+    async def flush(items):
+        batches.append(items)
+        return [value * 2 for _, value in items]
+
+    async def test():
+        writes = coalescer(flush)
+        return await asyncio.gather(*(writes.submit((key, key)) for key in range(3)))
+
+    assert asyncio.run(test()) == [0, 2, 4]
+    assert batches == [[(0, 0), (1, 1), (2, 2)]]
+
+
+def test_items_with_the_same_key_go_in_separate_batches():
+    batches = []
+
+    async def flush(items):
+        batches.append(items)
+        return [value for _, value in items]
+
+    async def test():
+        writes = coalescer(flush)
+        return await asyncio.gather(
+            writes.submit(("a", 1)), writes.submit(("b", 2)), writes.submit(("a", 3))
+        )
+
+    assert asyncio.run(test()) == [1, 2, 3]
+    assert batches == [[("a", 1), ("b", 2)], [("a", 3)]]
+
+
+def test_an_error_stays_with_its_item():
+    async def flush(items):
+        return [ValueError(key) if key == "b" else key for key, _ in items]
+
+    async def test():
+        writes = coalescer(flush)
+        return await asyncio.gather(
+            *(writes.submit((key, None)) for key in "abc"), return_exceptions=True
+        )
+
+    a, b, c = asyncio.run(test())
+    assert (a, c) == ("a", "c")
+    assert isinstance(b, ValueError)
+
+
+def test_a_record_deleted_before_the_read_back_is_still_written(run_api, monkeypatch):
+    collection = database.collection
+
+    class Racing:
+        def __init__(self, name):
+            self.collection = collection(name)
+
+        def __getattr__(self, name):
+            return getattr(self.collection, name)
+
+        async def bulk_write(self, *args, **kwargs):
+            result = await self.collection.bulk_write(*args, **kwargs)
+            # a concurrent DELETE lands between the write and the read back
+            await self.collection.delete_many({})
+            return result
+
+    async def test(client):
+        monkeypatch.setattr(database, "collection", Racing)
+        other = {**SCHOOL, "schoolId": SCHOOL["schoolId"] + 1}
+        return await asyncio.gather(
+            client.post("/schools", json=SCHOOL), client.post("/schools", json=other)
+        )
+
+    for response, school in zip(run_api(test), (SCHOOL, {"schoolId": 255901002})):
+        assert response.status_code in (200, 201)
+        assert response.json()["schoolId"] == school["schoolId"]
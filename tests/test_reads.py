@@ -0,0 +1,22 @@
+import database
+from conftest import SCHOOL
+from mongomock_motor import AsyncMongoMockClient
+
+
+def test_caches_are_filled_from_the_primary(run_api, monkeypatch):
+    """A secondary that has not caught up must not fill write-cleared caches"""
+    secondary = AsyncMongoMockClient()[database.database_name]
+    monkeypatch.setattr(database, "read_collection", lambda name: secondary[name])
+
+    async def test(client):
+        id = (await client.post("/schools", json=SCHOOL)).json()["id"]
+        item = await client.get(f"/schools/{id}")
+        page = await client.get("/schools", params={"schoolId": SCHOOL["schoolId"]})
+        fields = await client.get(f"/schools/{id}", params={"fields": "schoolId"})
+        return item, page, fields
+
+    item, page, fields = run_api(test)
+    assert item.status_code == 200
+    assert [school["schoolId"] for school in page.json()] == [SCHOOL["schoolId"]]
+    # reads that bypass the caches still use the read preference
+    assert fields.status_code == 404
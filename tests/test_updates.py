@@ -0,0 +1,136 @@
+import copy
+
+import database
+import pytest
+from bson.objectid import ObjectId
+from conftest import SCHOOL
+from upserts import merge_patch, update_diff
+
+
+def test_update_diff_sets_changed_and_unsets_removed_fields():
+    stored = {"_id": 1, "name": "a", "address": {"city": "x", "zip": "1"}, "web": "w"}
+    document = {"name": "b", "address": {"city": "y", "zip": "1"}}
+    assert update_diff(stored, document) == {
+        "$set": {"name": "b", "address.city": "y"},
+        "$unset": {"web": ""},
+    }
+
+
+def test_update_diff_pushes_appended_items_and_sets_other_arrays():
+    stored = {"grades": [9, 10], "codes": [1, 2]}
+    document = {"grades": [9, 10, 11], "codes": [2]}
+    assert update_diff(stored, document) == {
+        "$set": {"codes": [2]},
+        "$push": {"grades": {"$each": [11]}},
+    }
+
+
+def test_update_diff_keeps_versions_and_tells_equal_values_of_other_types_apart():
+    stored = {"_id": 1, "change_version": 1, "count": 1, "flag": 1}
+    document = {"change_version": 2, "count": 1, "flag": True}
+    assert update_diff(stored, document) == {"$set": {"flag": True}}
+    assert update_diff({"a": [1, {"b": 2}]}, {"a": [1, {"b": 2}]}) == {}
+
+
+@pytest.mark.parametrize(
+    "target, patch, merged",
+    [
+        # examples from RFC 7396, appendix A
+        ({"a": "b"}, {"a": "c"}, {"a": "c"}),
+        ({"a": "b"}, {"b": "c"}, {"a": "b", "b": "c"}),
+        ({"a": "b"}, {"a": None}, {}),
+        ({"a": "b", "b": "c"}, {"a": None}, {"b": "c"}),
+        ({"a": ["b"]}, {"a": "c"}, {"a": "c"}),
+        ({"a": "c"}, {"a": ["b"]}, {"a": ["b"]}),
+        ({"a": {"b": "c"}}, {"a": {"b": "d", "c": None}}, {"a": {"b": "d"}}),
+        ({"a": [{"b": "c"}]}, {"a": [1]}, {"a": [1]}),
+        (["a", "b"], ["c", "d"], ["c", "d"]),
+        ({"a": "b"}, ["c"], ["c"]),
+        ({"a": "foo"}, None, None),
+        ({"a": "foo"}, "bar", "bar"),
+        ({"e": None}, {"a": 1}, {"e": None, "a": 1}),
+        ([1, 2], {"a": "b", "c": None}, {"a": "b"}),
+        ({}, {"a": {"bb": {"ccc": None}}}, {"a": {"bb": {}}}),
+    ],
+)
+def test_merge_patch(target, patch, merged):
+    original = copy.deepcopy(target)
+    assert merge_patch(target, patch) == merged
+    assert target == original
+
+
+def test_patch_is_reapplied_to_a_concurrent_write(run_api, monkeypatch):
+    """
+    Another client's write lands between the PATCH's read and its
+    conditional write; the retry must keep that write
+    """
+    concurrent = []
+    collection = database.collection
+
+    class Racing:
+        def __init__(self, name):
+            self.collection = collection(name)
+
+        def __getattr__(self, name):
+            return getattr(self.collection, name)
+
+        async def find_one(self, *args, **kwargs):
+            found = await self.collection.find_one(*args, **kwargs)
+            if concurrent:
+                await self.collection.update_one(*concurrent.pop())
+            return found
+
+    async def test(client):
+        response = await client.post("/schools", json=SCHOOL)
+        id = response.json()["id"]
+        monkeypatch.setattr(database, "collection", Racing)
+        concurrent.append(
+            (
+                {"_id": ObjectId(id)},
+                {
+                    "$set": {
+                        "short_name_of_institution": "GBHS",
+                        "content_hash": "written by another client",
+                    }
+                },
+            )
+        )
+        response = await client.patch(
+            f"/schools/{id}", json={"nameOfInstitution": "Grand Bend HS"}
+        )
+        assert response.status_code == 204
+        assert not concurrent
+        monkeypatch.setattr(database, "collection", collection)
+        return (await client.get(f"/schools/{id}")).json()
+
+    school = run_api(test)
+    assert school["nameOfInstitution"] == "Grand Bend HS"
+    assert school["shortNameOfInstitution"] == "GBHS"
+    assert school["schoolTypeDescriptor"] == SCHOOL["schoolTypeDescriptor"]
+
+
+def test_patch_validates_the_patched_resource(run_api):
+    async def test(client):
+        id = (await client.post("/schools", json=SCHOOL)).json()["id"]
+        response = await client.patch(f"/schools/{id}", json={"schoolId": "x"})
+        assert response.status_code == 422
+        response = await client.patch(f"/schools/{id}", json={"schoolId": 1})
+        assert response.status_code == 400
+        response = await client.patch(f"/schools/{id}", json={"webSite": "w"})
+        assert response.status_code == 204
+        assert response.headers["ETag"]
+        return (await client.get(f"/schools/{id}")).json()
+
+    school = run_api(test)
+    assert school["webSite"] == "w"
+    assert school["nameOfInstitution"] == SCHOOL["nameOfInstitution"]
+
+
+@pytest.mark.parametrize("method", ["GET", "PUT", "PATCH", "DELETE"])
+@pytest.mark.parametrize("id", ["nope", "zzzzzzzzzzzzzzzzzzzzzzzz"])
+def test_ids_that_are_not_object_ids_are_not_found(run_api, method, id):
+    async def test(client):
+        body = SCHOOL if method in ("PUT", "PATCH") else None
+        return await client.request(method, f"/schools/{id}", json=body)
+
+    assert run_api(test).status_code == 404